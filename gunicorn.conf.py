@@ -22,6 +22,15 @@ errorlog = "-"
 loglevel = "info"
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
 
+
+# Background work runs in each worker, never in the master process
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    # pylint: disable=import-outside-toplevel
+    from all_your_tube.app import init_background
+
+    init_background()
+
+
 # Process naming
 proc_name = "all-your-tube"
 
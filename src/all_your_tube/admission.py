@@ -0,0 +1,221 @@
+"""
+Per-site admission control for downloads.
+
+Each site gets a limit on concurrent downloads and on how many may start per
+minute, so a burst of links does not get the host throttled. Downloads over
+the limits wait in a bounded per-site pending queue that is drained in the
+background; once that is full, new downloads are turned away with a hint of
+when to retry. State is shared by all workers through a locked file.
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+from . import supervisor
+
+SITE_CONCURRENCY = int(os.environ.get("AYT_SITE_CONCURRENCY", 2))
+SITE_RATE_PER_MINUTE = int(os.environ.get("AYT_SITE_RATE_PER_MINUTE", 10))
+SITE_MAX_PENDING = int(os.environ.get("AYT_SITE_MAX_PENDING", 20))
+
+RATE_WINDOW = 60
+DISPATCH_INTERVAL = 1
+# Admitted downloads that never reported a PID are assumed to have failed
+SPAWN_GRACE = 60
+# Retry hint when the site is only limited by concurrency
+DEFAULT_RETRY_AFTER = 30
+
+# Hosts whose short links belong to another site
+SITE_ALIASES = {"youtu.be": "youtube.com"}
+
+STATE_DIR = Path(os.environ.get("AYT_WORKDIR", ".")) / ".cache"
+STATE_FILE = "admission.json"
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def site_key(url):
+    """Group a URL by the site it downloads from"""
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    labels = host.split(".")
+
+    # Keep a label more for country domains like bbc.co.uk
+    keep = 2
+    if len(labels) > 2 and len(labels[-1]) == 2 and len(labels[-2]) < 4:
+        keep = 3
+    site = ".".join(labels[-keep:])
+    return SITE_ALIASES.get(site, site)
+
+
+@contextlib.contextmanager
+def _locked_state():
+    """Load the shared admission state and save it back on exit"""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    path = STATE_DIR / STATE_FILE
+    with open(path.with_suffix(".lock"), "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            state = {"sites": {}}
+
+        yield state
+
+        tmp_path = path.with_name(f".{STATE_FILE}.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+
+def _site_state(state, site, now):
+    """Get a site's state with finished downloads and old starts dropped"""
+    site_state = state["sites"].setdefault(
+        site, {"running": [], "starts": [], "pending": []}
+    )
+
+    def still_running(entry):
+        if entry["pid"] is None:
+            return now - entry["admitted_at"] < SPAWN_GRACE
+        return supervisor.job_running(entry["pid"], entry["workdir"])
+
+    site_state["running"] = [e for e in site_state["running"] if still_running(e)]
+    site_state["starts"] = [t for t in site_state["starts"] if now - t < RATE_WINDOW]
+    return site_state
+
+
+def _has_slot(site_state):
+    """Check whether a site can start another download now"""
+    return (
+        len(site_state["running"]) < SITE_CONCURRENCY
+        and len(site_state["starts"]) < SITE_RATE_PER_MINUTE
+    )
+
+
+def _take_slot(site_state, job, now):
+    """Count a job as running for its site"""
+    site_state["running"].append(
+        {"id": job["id"], "pid": None, "workdir": job["workdir"], "admitted_at": now}
+    )
+    site_state["starts"].append(now)
+
+
+def _retry_after(site_state, now):
+    """Estimate the seconds until a site can take on more work"""
+    if len(site_state["starts"]) >= SITE_RATE_PER_MINUTE:
+        return max(1, math.ceil(site_state["starts"][0] + RATE_WINDOW - now))
+    return DEFAULT_RETRY_AFTER
+
+
+def admit(job):
+    """Decide whether a job starts now, waits, or is rejected.
+
+    ``job`` must be JSON serialisable with an ``id``, ``url`` and ``workdir``,
+    as pending jobs may be started by another worker. Returns ``("start",
+    None)``, ``("pending", None)`` or ``("rejected", retry_after)``. Jobs
+    that start must be reported with ``mark_started``.
+    """
+    now = time.time()
+    site = site_key(job["url"])
+    job["site"] = site
+
+    with _locked_state() as state:
+        site_state = _site_state(state, site, now)
+
+        # Jobs already waiting go first
+        if not site_state["pending"] and _has_slot(site_state):
+            _take_slot(site_state, job, now)
+            return "start", None
+
+        if len(site_state["pending"]) < SITE_MAX_PENDING:
+            site_state["pending"].append(job)
+            logger.info("Download %s waiting for a %s slot", job["id"], site)
+            return "pending", None
+
+        return "rejected", _retry_after(site_state, now)
+
+
+def mark_started(job, pid):
+    """Record the PID of an admitted job so its slot is freed when it exits"""
+    with _locked_state() as state:
+        site_state = state["sites"].get(job["site"], {"running": []})
+        for entry in site_state["running"]:
+            if entry["id"] == job["id"]:
+                entry["pid"] = pid
+
+
+def release(job):
+    """Give back the slot of an admitted job that could not be started"""
+    with _locked_state() as state:
+        site_state = state["sites"].get(job["site"], {"running": []})
+        site_state["running"] = [
+            entry for entry in site_state["running"] if entry["id"] != job["id"]
+        ]
+
+
+def take_ready():
+    """Claim the pending jobs that can start now, across all sites"""
+    now = time.time()
+    ready = []
+    with _locked_state() as state:
+        for site in list(state["sites"]):
+            site_state = _site_state(state, site, now)
+            while site_state["pending"] and _has_slot(site_state):
+                job = site_state["pending"].pop(0)
+                _take_slot(site_state, job, now)
+                ready.append(job)
+
+            if not any(site_state.values()):
+                del state["sites"][site]
+    return ready
+
+
+def _start_ready_job(job, start_job, fail_job):
+    """Start a claimed job, or give its slot back and report why it could not"""
+    try:
+        pid = start_job(job)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.exception("Starting download %s failed", job["id"])
+        release(job)
+        fail_job(job, e)
+        return
+    mark_started(job, pid)
+
+
+def dispatch_ready(start_job, fail_job):
+    """Start every pending job that can start now.
+
+    Claimed jobs are no longer pending, so one that fails to start is passed
+    to ``fail_job`` rather than dropped, and does not hold up the rest.
+    """
+    for job in take_ready():
+        try:
+            _start_ready_job(job, start_job, fail_job)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Dispatching download %s failed", job["id"])
+
+
+def start_dispatcher(start_job, fail_job):
+    """Start pending jobs in the background as their sites free up.
+
+    ``start_job(job)`` must launch the job and return its PID, and
+    ``fail_job(job, error)`` records that a job could not be started.
+    """
+
+    def run():
+        while True:
+            time.sleep(DISPATCH_INTERVAL)
+            try:
+                dispatch_ready(start_job, fail_job)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Dispatching pending downloads failed")
+
+    threading.Thread(target=run, daemon=True).start()
@@ -5,6 +5,7 @@ Collect yt-dlp parameters through a web form using Flask.
 import logging
 import os
 import subprocess
+import threading
 import urllib.parse
 from pathlib import Path
 from shlex import quote
@@ -13,8 +14,11 @@ from flask import Blueprint, Flask, Response, jsonify, render_template, request,
 from ulid import ULID
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-from . import log_monitoring
-from .queue import queue_bp
+from . import admission, cookies, dedup, log_monitoring, storage, supervisor
+from .queue import QUEUE_DIR, queue_bp, recover_queue
+from .streaming import streaming_bp
+from .subscriptions import start_scheduler, subscriptions_bp
+from .timeline import JobTimeline, start_pruner, timeline_bp
 from .utils import get_cookies, validate_input
 
 PREFIX = "/yourtube"
@@ -79,6 +83,92 @@ def stream(pid):
     return response
 
 
+def trace_download(process, log_file, timeline, cookie_args=""):
+    """Record the phases of a /save download from its log"""
+    supervisor.follow_log(log_file, lambda: process.poll() is None, timeline.observe)
+    cookies.release_job_jars(cookie_args)
+    timeline.finish("completed" if process.returncode == 0 else "failed")
+
+
+def start_save_job(job):
+    """Launch an admitted /save download and return the PID of its shell"""
+    workdir = Path(job["workdir"])
+    job_log = job["id"] + ".log"
+    ytargs = job["args"]
+
+    # Add cookie support if AYT_YTDLP_COOKIE is set
+    cookie_args = get_cookies()
+    if cookie_args:
+        ytargs += f" {cookie_args}"
+
+    ytargs += " " + quote(job["url"])
+    app.logger.info("Running with yt-dlp args: %s", ytargs)
+
+    timeline = JobTimeline.load(job["id"], "save")
+    timeline.start_phase("extraction")
+
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(
+        [
+            "/bin/bash",
+            "-c",
+            f"yt-dlp {ytargs} >> {job_log} 2>&1 && echo 'Download Complete' >> {job_log}",
+        ],
+        stderr=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+        cwd=workdir,
+    )
+    threading.Thread(
+        target=trace_download,
+        args=(process, workdir / job_log, timeline, cookie_args),
+        daemon=True,
+    ).start()
+
+    return process.pid
+
+
+def fail_save_job(job, error):
+    """Record that a pending /save download could not be started"""
+    log_file = Path(job["workdir"]) / (job["id"] + ".log")
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"Download could not be started: {error}\n")
+    JobTimeline.load(job["id"], "save").finish("failed")
+
+
+def admit_save_job(job, directory):
+    """Start, queue or reject a /save download under the per-site limits.
+
+    Returns the seconds to wait before retrying if the job was rejected.
+    """
+    log_file = Path(job["workdir"]) / (job["id"] + ".log")
+
+    # The log and timeline must exist before a pending job can be started
+    with open(log_file, "w", encoding="utf-8") as f:
+        f.write("Starting...\n")
+    timeline = JobTimeline(job["id"], "save", url=job["url"], directory=directory)
+    timeline.start_phase("queue_wait")
+
+    decision, retry_after = admission.admit(job)
+    if decision == "start":
+        admission.mark_started(job, start_save_job(job))
+    elif decision == "pending":
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(f"Waiting for a {job['site']} download slot...\n")
+    else:
+        log_file.unlink()
+        timeline.finish("rejected")
+
+    return retry_after
+
+
+def _throttled(retry_after):
+    """Status and headers for a response, 429 if the download was turned away"""
+    if retry_after:
+        return 429, {"Retry-After": str(retry_after)}
+    return 200, {}
+
+
 @bp.route("/save", methods=["POST"])
 def download_video():
     """Perform yt-dlp command from form data"""
@@ -104,14 +194,9 @@ def download_video():
     )
     yt_env_args = os.environ.get("AYT_YTDLP_ARGS", default_params)
 
-    # Add cookie support if AYT_YTDLP_COOKIE is set
-    cookie_args = get_cookies()
-    if cookie_args:
-        yt_env_args += f" {cookie_args}"
-
-    ytargs = yt_env_args + " " + quote(path)
     workdir = WORKDIR
     pid = None
+    retry_after = None
 
     if success and (path and "http" in path):
         if target_dir:
@@ -124,24 +209,21 @@ def download_video():
 
         # Use a ULID to refer to the download logs
         pid = str(ULID())
-        job_log = pid + ".log"
-        app.logger.info("Running with yt-dlp args: %s", ytargs)
-
-        with open(workdir / job_log, "w", encoding="utf-8") as f:
-            f.write("Starting...\n")
-
-        # pylint: disable=consider-using-with
-        subprocess.Popen(
-            [
-                "/bin/bash",
-                "-c",
-                f"yt-dlp {ytargs} >> {job_log} 2>&1 && echo 'Download Complete' >> {job_log}",
-            ],
-            stderr=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            start_new_session=True,
-            cwd=workdir,
-        )
+        job = {
+            "id": pid,
+            "url": path,
+            "args": yt_env_args,
+            "workdir": str(workdir),
+        }
+
+        retry_after = admit_save_job(job, target_dir)
+        if retry_after:
+            success = False
+            pid = None
+            error_message = (
+                f"Too many downloads from {job['site']}, "
+                f"try again in {retry_after} seconds"
+            )
 
     # Check if this is an AJAX request
     if (
@@ -159,14 +241,17 @@ def download_video():
                 }
             )
 
-        return jsonify(
-            {
-                "success": False,
-                "error": error_message or "Invalid URL or missing required fields",
-            }
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": error_message or "Invalid URL or missing required fields",
+                }
+            ),
+            *_throttled(retry_after),
         )
 
-    return render_template("index.html")
+    return render_template("index.html"), *_throttled(retry_after)
 
 
 @bp.route("/", methods=["GET"])
@@ -178,6 +263,24 @@ def index():
 # Register blueprints at module level for both dev and production
 app.register_blueprint(bp, url_prefix=PREFIX)
 app.register_blueprint(queue_bp, url_prefix=PREFIX)
+app.register_blueprint(streaming_bp, url_prefix=PREFIX)
+app.register_blueprint(timeline_bp, url_prefix=PREFIX)
+app.register_blueprint(subscriptions_bp, url_prefix=PREFIX)
+
+
+def init_background():
+    """Start the background work of a serving process.
+
+    Called once per gunicorn worker, or by the development server, rather
+    than on import so that the gunicorn launcher and tests run none of it.
+    """
+    # Pick up queue downloads left behind by a recycled gunicorn worker
+    recover_queue()
+    storage.start_collector(QUEUE_DIR)
+    admission.start_dispatcher(start_save_job, fail_save_job)
+    start_scheduler()
+    dedup.start_deduplicator(WORKDIR)
+    start_pruner()
 
 
 def main():
@@ -186,6 +289,7 @@ def main():
     port = int(os.environ.get("AYT_PORT", 1424))
     app.debug = os.environ.get("AYT_DEBUG", False)
 
+    init_background()
     app.run(host=host, port=port, threaded=True)
 
 
@@ -0,0 +1,196 @@
+"""
+Shared cookie jar for yt-dlp jobs.
+
+Extracting cookies from a browser decrypts and parses its cookie database on
+every yt-dlp call. Instead the browser cookies are exported once to a Netscape
+jar under the cache directory, refreshed on a TTL or after an authentication
+failure, and every job is handed its own copy since yt-dlp writes the jar back
+when it exits.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import time
+import uuid
+from pathlib import Path
+
+COOKIE_TTL = int(os.environ.get("AYT_COOKIE_TTL", 3600))
+
+# Per-job copies are deleted when their job ends; any older than this were
+# left behind by a worker that died
+JOB_JAR_MAX_AGE = 24 * 60 * 60
+PRUNE_INTERVAL = 10 * 60
+
+AUTH_FAILURE_MARKERS = (
+    "sign in to confirm",
+    "use --cookies",
+    "login required",
+    "http error 401",
+)
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+_prune_state = {"last_run": 0.0}
+
+
+def _cache_dir():
+    """Return the cookie cache directory inside the working directory.
+
+    The jars hold every cookie in the browser and the working directory is
+    often a shared volume, so only the app's own user may read them.
+    """
+    cache_dir = Path(os.environ.get("AYT_WORKDIR", ".")) / ".cache" / "cookies"
+    (cache_dir / "jobs").mkdir(mode=0o700, parents=True, exist_ok=True)
+    for directory in (cache_dir, cache_dir / "jobs"):
+        if directory.stat().st_mode & 0o077:
+            directory.chmod(0o700)
+    return cache_dir
+
+
+def _jar_path(browser_args):
+    """Name the jar after the browser spec so a config change starts afresh"""
+    digest = hashlib.sha1(shlex.join(browser_args).encode()).hexdigest()[:12]
+    return _cache_dir() / f"browser-{digest}.txt"
+
+
+def _jar_is_fresh(jar):
+    """Check that the jar exists, is non-empty and is within the TTL"""
+    try:
+        stat = jar.stat()
+    except FileNotFoundError:
+        return False
+    return stat.st_size > 0 and time.time() - stat.st_mtime < COOKIE_TTL
+
+
+def _export_browser_cookies(browser_args, jar):
+    """Have yt-dlp dump the browser cookies into a Netscape jar"""
+    tmp_jar = jar.with_name(f".{jar.name}.{os.getpid()}")
+    tmp_jar.unlink(missing_ok=True)
+
+    # Without a URL yt-dlp exits with a usage error, but still saves the
+    # cookie jar on the way out, so judge success by the written file
+    cmd = ["yt-dlp", *browser_args, "--cookies", str(tmp_jar)]
+    try:
+        subprocess.run(cmd, capture_output=True, timeout=120, check=False)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.error("Cookie export failed: %s", e)
+        return False
+
+    if not tmp_jar.exists() or tmp_jar.stat().st_size == 0:
+        logger.error("Cookie export did not produce a jar")
+        tmp_jar.unlink(missing_ok=True)
+        return False
+
+    os.chmod(tmp_jar, 0o600)
+    os.replace(tmp_jar, jar)
+    logger.info("Exported browser cookies to %s", jar)
+    return True
+
+
+def _prune_job_jars(cache_dir):
+    """Remove per-job jar copies left behind by finished downloads"""
+    if time.monotonic() - _prune_state["last_run"] < PRUNE_INTERVAL:
+        return
+    _prune_state["last_run"] = time.monotonic()
+
+    cutoff = time.time() - JOB_JAR_MAX_AGE
+    for job_jar in (cache_dir / "jobs").iterdir():
+        try:
+            if job_jar.stat().st_mtime < cutoff:
+                job_jar.unlink()
+        except FileNotFoundError:
+            continue
+
+
+@contextlib.contextmanager
+def _locked_jar(jar):
+    """Hold a jar's lock, so no other thread or worker exports or discards it"""
+    with open(jar.with_suffix(".lock"), "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _copy_jar(jar, job_jar):
+    """Copy a jar to a new file only the app's own user may read"""
+    fd = os.open(job_jar, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with open(fd, "wb") as dst, open(jar, "rb") as src:
+            shutil.copyfileobj(src, dst)
+    except OSError:
+        job_jar.unlink(missing_ok=True)
+        raise
+
+
+def invalidate_cookie_jar():
+    """Discard exported jars so the next job re-exports from the browser.
+
+    Returns True if a jar was discarded.
+    """
+    discarded = False
+    for jar in _cache_dir().glob("browser-*.txt"):
+        # Wait for any copy being taken from the jar to finish
+        with _locked_jar(jar):
+            try:
+                jar.unlink()
+                discarded = True
+            except FileNotFoundError:
+                continue
+    if discarded:
+        logger.info("Discarded cached cookie jar")
+    return discarded
+
+
+def is_auth_failure(output):
+    """Check yt-dlp output for signs the cookies were rejected"""
+    output = (output or "").lower()
+    return any(marker in output for marker in AUTH_FAILURE_MARKERS)
+
+
+def job_cookie_args(cookie_args):
+    """Swap --cookies-from-browser for a private copy of the cached jar.
+
+    Any other arguments are kept. Falls back to the original arguments if
+    the browser cookies could not be exported or copied.
+    """
+    parts = shlex.split(cookie_args)
+    index = parts.index("--cookies-from-browser")
+    browser_args = parts[index : index + 2]
+    other_args = parts[:index] + parts[index + 2 :]
+
+    jar = _jar_path(browser_args)
+    cache_dir = jar.parent
+    _prune_job_jars(cache_dir)
+    job_jar = cache_dir / "jobs" / f"{uuid.uuid4().hex}.txt"
+
+    # Only one thread or worker exports at a time, the rest wait and reuse
+    # it, and the jar cannot be discarded while it is being copied
+    with _locked_jar(jar):
+        if not (_jar_is_fresh(jar) or _export_browser_cookies(browser_args, jar)):
+            return cookie_args
+        try:
+            _copy_jar(jar, job_jar)
+        except OSError as e:
+            logger.error("Could not copy cookie jar: %s", e)
+            return cookie_args
+
+    return " ".join(other_args + ["--cookies", str(job_jar)])
+
+
+def job_jars(args):
+    """Return the per-job jar copies named in yt-dlp arguments"""
+    parts = args.split() if isinstance(args, str) else args
+    jobs_dir = _cache_dir() / "jobs"
+    return [Path(part) for part in parts if Path(part).parent == jobs_dir]
+
+
+def release_job_jars(args):
+    """Delete the per-job jar copies named in yt-dlp arguments"""
+    for job_jar in job_jars(args):
+        job_jar.unlink(missing_ok=True)
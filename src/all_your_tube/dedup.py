@@ -0,0 +1,228 @@
+"""
+Content-hash deduplication of downloaded media.
+
+The same video often ends up in several download folders, or comes from
+different URLs as byte-identical files. A background pass hashes the media
+in the download directory and replaces identical copies on the same
+filesystem with hard links to one of them. Hashes are kept in an index
+keyed by path, so a pass only hashes files that are new or have changed,
+and only files that share their size with another file are hashed at all.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from . import supervisor
+
+# Seconds between deduplication passes, 0 to disable
+DEDUP_INTERVAL = int(os.environ.get("AYT_DEDUP_INTERVAL", 60 * 60))
+
+CHUNK_SIZE = 1024 * 1024
+# Files modified more recently than this may still be being written
+SETTLE_TIME = 5 * 60
+
+MEDIA_EXTENSIONS = (
+    ".aac",
+    ".avi",
+    ".flac",
+    ".flv",
+    ".m4a",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".ogg",
+    ".opus",
+    ".wav",
+    ".webm",
+)
+# Directories under the download directory that do not hold the library
+EXCLUDED_DIRS = ("logs", "queue", "subscriptions")
+
+INDEX_FILE = "dedup-index.json"
+DEDUP_LOCK_FILE = "dedup.lock"
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def iter_media(root):
+    """Yield the media files under root, skipping app state directories"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == str(root):
+            dirnames[:] = [d for d in dirnames if d not in EXCLUDED_DIRS]
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if not name.startswith(".") and name.lower().endswith(MEDIA_EXTENSIONS):
+                yield Path(dirpath) / name
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _index_path(root):
+    """Return where the hash index for root is stored"""
+    return Path(root) / ".cache" / INDEX_FILE
+
+
+def load_index(root):
+    """Read the hash index, returning an empty one if there is none"""
+    try:
+        with open(_index_path(root), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_index(root, index):
+    """Atomically write the hash index"""
+    path = _index_path(root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{INDEX_FILE}.{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def _stat_entry(stat):
+    """Index fields that change whenever a file's content may have changed"""
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "dev": stat.st_dev,
+        "ino": stat.st_ino,
+    }
+
+
+def _matches(entry, stat):
+    """Check whether an index entry still describes a file"""
+    return all(entry.get(key) == value for key, value in _stat_entry(stat).items())
+
+
+def update_index(root, index):
+    """Bring the index up to date with the media under root.
+
+    Files whose size and modification time are unchanged keep their hash.
+    Returns the number of files hashed.
+    """
+    now = time.time()
+    current = {}
+    for path in iter_media(root):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if now - stat.st_mtime < SETTLE_TIME:
+            continue
+
+        entry = _stat_entry(stat)
+        previous = index.get(str(path), {})
+        entry["sha256"] = previous.get("sha256") if _matches(previous, stat) else None
+        current[str(path)] = entry
+
+    # A file with a size no other file has cannot have a duplicate
+    sizes = {}
+    for entry in current.values():
+        sizes[entry["size"]] = sizes.get(entry["size"], 0) + 1
+
+    hashed = 0
+    for path, entry in current.items():
+        if entry["sha256"] is None and sizes[entry["size"]] > 1:
+            try:
+                entry["sha256"] = file_digest(path)
+                hashed += 1
+            except OSError as e:
+                logger.warning("Could not hash %s: %s", path, e)
+
+    index.clear()
+    index.update(current)
+    return hashed
+
+
+def _replace_with_link(source, target):
+    """Atomically replace target with a hard link to source"""
+    target = Path(target)
+    tmp_path = target.with_name(f".{target.name}.dedup")
+    os.link(source, tmp_path)
+    try:
+        os.replace(tmp_path, target)
+    except OSError:
+        tmp_path.unlink()
+        raise
+
+
+def link_duplicates(index):
+    """Hard link files with identical content; returns the bytes freed"""
+    groups = {}
+    for path, entry in sorted(index.items()):
+        if entry["sha256"] is not None:
+            key = (entry["dev"], entry["size"], entry["sha256"])
+            groups.setdefault(key, []).append(path)
+
+    freed = 0
+    for paths in groups.values():
+        source = paths[0]
+        for path in paths[1:]:
+            entry = index[path]
+            if entry["ino"] == index[source]["ino"]:
+                continue
+
+            # Leave files alone that changed since they were hashed
+            try:
+                stat = os.stat(path)
+                if not _matches(entry, stat) or not _matches(
+                    index[source], os.stat(source)
+                ):
+                    continue
+                _replace_with_link(source, path)
+            except OSError as e:
+                logger.warning("Could not link %s to %s: %s", path, source, e)
+                continue
+
+            index[path] = dict(index[source])
+            # Space is only freed once the last link to the copy is gone
+            if stat.st_nlink == 1:
+                freed += entry["size"]
+            logger.info("Linked duplicate %s to %s", path, source)
+    return freed
+
+
+def deduplicate(root):
+    """Run one deduplication pass over root; returns the bytes freed"""
+    index = load_index(root)
+    hashed = update_index(root, index)
+    freed = link_duplicates(index)
+    save_index(root, index)
+    logger.info("Deduplication hashed %d files and freed %d bytes", hashed, freed)
+    return freed
+
+
+def start_deduplicator(root):
+    """Run deduplication passes in the background of this worker.
+
+    Every worker starts one, but only one pass runs at a time across them.
+    """
+    if not DEDUP_INTERVAL:
+        return
+
+    supervisor.start_periodic_task(
+        DEDUP_INTERVAL,
+        Path(root) / ".cache" / DEDUP_LOCK_FILE,
+        lambda: deduplicate(root),
+        "Deduplication",
+    )
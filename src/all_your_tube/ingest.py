@@ -0,0 +1,205 @@
+"""
+Headless bulk ingest of URL lists into the download queue.
+
+URLs are read from files or stdin and run through the same queue pipeline and
+storage layout as ``/queue-download``, without the web tier. Jobs are durable,
+so an interrupted ingest picks up where it left off when run again: finished
+URLs are skipped, running downloads are reattached to and the rest are
+started afresh.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from queue import Queue
+
+from . import supervisor
+from .utils import validate_input
+
+try:
+    from . import queue
+except RuntimeError:
+    # AYT_WORKDIR is not set, which main reports as a usage error
+    queue = None  # pylint: disable=invalid-name
+
+# How often to check on a job another process is supervising
+POLL_INTERVAL = 5
+
+
+def _read_lines(source):
+    """Yield the lines of a file, or of stdin for '-'"""
+    if source == "-":
+        yield from sys.stdin
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        yield from f
+
+
+def read_urls(sources):
+    """Yield URLs from the given files, or stdin if there are none"""
+    for source in sources or ["-"]:
+        for line in _read_lines(source):
+            url = line.strip()
+            if url and not url.startswith("#"):
+                yield url
+
+
+def existing_jobs(quality):
+    """Map each URL already in the queue at this quality to its latest job"""
+    jobs = {}
+    for job_dir, record in supervisor.iter_jobs(queue.QUEUE_DIR):
+        if record.get("quality") != quality:
+            continue
+        latest = jobs.get(record["url"])
+        if latest is None or record["created_at"] > latest[1]["created_at"]:
+            jobs[record["url"]] = (job_dir.name, record)
+    return jobs
+
+
+def _wait_for_job(queue_id):
+    """Block until a job reaches a terminal state and return its record"""
+    while True:
+        record = supervisor.load_job(queue.QUEUE_DIR / queue_id)
+        if record is None or record["status"] in supervisor.TERMINAL_STATES:
+            return record
+        time.sleep(POLL_INTERVAL)
+
+
+def ingest_url(url, quality, previous=None):
+    """Run one URL through the queue pipeline; returns its final status"""
+    if previous is not None:
+        queue_id, record = previous
+        # Expired outputs were downloaded once, then collected
+        if record["status"] in ("completed", "expired"):
+            return "skipped"
+        if record["status"] not in supervisor.TERMINAL_STATES:
+            queue.resume_queue_item(queue_id, record)
+            record = _wait_for_job(queue_id)
+            return record["status"] if record else "failed"
+
+    # Archives are kept out of quota and TTL eviction
+    item = queue.enqueue(url, quality, keep=True)
+    if item is None:
+        return "failed"
+
+    queue.process_queue_item(item["id"])
+    record = _wait_for_job(item["id"])
+    return record["status"] if record else "failed"
+
+
+class Progress:
+    """Thread-safe tally of ingest results"""
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, url, status):
+        """Count a finished URL and report it"""
+        with self.lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            done = sum(self.counts.values())
+            print(f"[{done}] {status}: {url}", flush=True)
+
+    def summary(self):
+        """Describe the results so far"""
+        with self.lock:
+            done = sum(self.counts.values())
+            parts = ", ".join(f"{n} {s}" for s, n in sorted(self.counts.items()))
+        return f"Ingested {done} URLs ({parts or 'none'})"
+
+
+def _worker(pending, quality, jobs, progress):
+    """Take URLs off the pending queue until told to stop"""
+    while True:
+        url = pending.get()
+        if url is None:
+            return
+        try:
+            status = ingest_url(url, quality, jobs.get(url))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error("Ingest of %s failed: %s", url, e)
+            status = "failed"
+        progress.record(url, status)
+
+
+def main(argv=None):
+    """Ingest URL lists into the download queue"""
+    parser = argparse.ArgumentParser(
+        description="Download URL lists through the all-your-tube queue."
+    )
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        help="files with one URL per line; reads stdin if omitted or '-'",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=2,
+        help="number of downloads to run at once (default: 2)",
+    )
+    parser.add_argument(
+        "-q", "--quality", default="best", help="best, 1080p, 720p, etc."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    if queue is None:
+        parser.error("the AYT_WORKDIR environment variable must be set")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    # Share yt-dlp's cache with the web app
+    cache_dir = queue.WORKDIR / ".cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["XDG_CACHE_HOME"] = str(cache_dir)
+
+    jobs = existing_jobs(args.quality)
+    progress = Progress()
+    parallelism = max(args.jobs, 1)
+
+    # Bounded so huge lists are streamed in rather than read up front
+    pending = Queue(maxsize=parallelism * 2)
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(pending, args.quality, jobs, progress),
+            daemon=True,
+        )
+        for _ in range(parallelism)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        seen = set()
+        for url in read_urls(args.sources):
+            if url in seen:
+                continue
+            seen.add(url)
+            if not validate_input(url):
+                progress.record(url, "invalid")
+                continue
+            pending.put(url)
+
+        for _ in workers:
+            pending.put(None)
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Downloads keep running detached and are picked up on the next run
+        print(progress.summary(), file=sys.stderr)
+        print("Interrupted, run again to resume", file=sys.stderr)
+        sys.exit(130)
+
+    print(progress.summary())
+    failed = progress.counts.get("failed", 0) + progress.counts.get("invalid", 0)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
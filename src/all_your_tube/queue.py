@@ -7,11 +7,15 @@ import logging
 import os
 import subprocess
 import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
 from flask import Blueprint, Response, jsonify, request
+from ulid import ULID
 
+from . import cookies, storage, supervisor
+from .timeline import JobTimeline
 from .utils import get_cookies, validate_input
 
 # Get WORKDIR from environment
@@ -24,7 +28,8 @@ WORKDIR = Path(WORKDIR)
 QUEUE_DIR = WORKDIR / "queue"
 QUEUE_DIR.mkdir(parents=True, exist_ok=True)
 
-# In-memory queue storage (for simplicity - could be replaced with Redis/DB)
+# In-memory view of the jobs this worker supervises, written through to
+# QUEUE_DIR/<queue_id>/job.json so that every worker can see them
 download_queue = {}
 queue_lock = threading.Lock()
 
@@ -32,30 +37,50 @@ queue_lock = threading.Lock()
 queue_bp = Blueprint("queue", __name__)
 
 
-@queue_bp.route("/queue-download", methods=["POST"])
-def queue_download():
-    """Queue a high-quality video for background processing"""
-    url = request.form.get("url")
-    quality = request.form.get("quality", "best")  # best, 1080p, 720p, etc.
-
-    if not url or not validate_input(url):
-        return jsonify({"error": "Invalid URL"}), 400
-
-    # Generate unique queue ID
-    queue_id = str(int(datetime.now().timestamp()))
-
-    # Get video metadata for title
+def _probe_metadata(url):
+    """Run yt-dlp to fetch video metadata without downloading"""
     cookie_args = get_cookies()
     cmd = ["yt-dlp", "--dump-json", "--no-download"]
     if cookie_args:
         cmd.extend(cookie_args.split())
     cmd.append(url)
-    result = subprocess.run(
-        cmd, capture_output=True, text=True, timeout=30, check=False
-    )
+    try:
+        return subprocess.run(
+            cmd, capture_output=True, text=True, timeout=30, check=False
+        )
+    finally:
+        cookies.release_job_jars(cmd)
+
+
+def enqueue(url, quality, keep=False, subscription=None):
+    """Probe a URL and add it to the queue without starting it.
+
+    Outputs of items queued with ``keep`` are never garbage collected. Items
+    queued for a ``subscription`` are started by its download slots, even
+    after a worker is recycled, rather than by queue recovery.
+    Returns a copy of the new queue item, or None if the metadata probe
+    failed.
+    """
+    # Generate unique queue ID
+    queue_id = str(ULID())
+
+    timeline = JobTimeline(queue_id, "queue", url=url, quality=quality)
+    timeline.start_phase("metadata_probe")
+
+    # Get video metadata for title
+    result = _probe_metadata(url)
+
+    # Rejected cookies may just be stale, so retry once with a fresh export
+    if (
+        result.returncode != 0
+        and cookies.is_auth_failure(result.stderr)
+        and cookies.invalidate_cookie_jar()
+    ):
+        result = _probe_metadata(url)
 
     if result.returncode != 0:
-        return jsonify({"error": "Failed to get video metadata"}), 400
+        timeline.finish("failed")
+        return None
 
     metadata = json.loads(result.stdout)
     title = metadata.get("title", "Unknown Video")
@@ -72,25 +97,70 @@ def queue_download():
             "created_at": datetime.now().isoformat(),
             "file_path": None,
             "error": None,
+            "pid": None,
+            "output_dir": str(QUEUE_DIR / queue_id),
+            "keep": keep,
+            "subscription": subscription,
         }
+        item = download_queue[queue_id].copy()
+    (QUEUE_DIR / queue_id).mkdir(exist_ok=True)
+    _persist_item(queue_id)
+    timeline.start_phase("queue_wait")
+
+    logging.info("Queued download %s: %s", queue_id, title)
+    return item
+
+
+@queue_bp.route("/queue-download", methods=["POST"])
+def queue_download():
+    """Queue a high-quality video for background processing"""
+    url = request.form.get("url")
+    quality = request.form.get("quality", "best")  # best, 1080p, 720p, etc.
+
+    if not url or not validate_input(url):
+        return jsonify({"error": "Invalid URL"}), 400
+
+    item = enqueue(url, quality)
+    if item is None:
+        return jsonify({"error": "Failed to get video metadata"}), 400
 
     # Start processing in background
+    queue_id = item["id"]
     threading.Thread(target=process_queue_item, args=(queue_id,), daemon=True).start()
 
-    logging.info("Queued download %s: %s", queue_id, title)
     return jsonify(
-        {"success": True, "queue_id": queue_id, "title": title, "status": "queued"}
+        {
+            "success": True,
+            "queue_id": queue_id,
+            "title": item["title"],
+            "status": "queued",
+        }
     )
 
 
+def _persist_item(queue_id):
+    """Write the current state of a queue item to its job directory"""
+    with queue_lock:
+        record = download_queue[queue_id].copy()
+    supervisor.save_job(QUEUE_DIR / queue_id, record)
+
+
+def _load_item(queue_id):
+    """Get a queue item, preferring the durable record shared by all workers"""
+    record = supervisor.load_job(QUEUE_DIR / queue_id)
+    if record is not None:
+        return record
+    with queue_lock:
+        item = download_queue.get(queue_id)
+        return item.copy() if item else None
+
+
 @queue_bp.route("/queue-status/<queue_id>")
 def queue_status(queue_id):
     """Get status of a queued download"""
-    with queue_lock:
-        if queue_id not in download_queue:
-            return jsonify({"error": "Queue item not found"}), 404
-
-        item = download_queue[queue_id].copy()
+    item = _load_item(queue_id)
+    if item is None:
+        return jsonify({"error": "Queue item not found"}), 404
 
     return jsonify(item)
 
@@ -98,8 +168,7 @@ def queue_status(queue_id):
 @queue_bp.route("/queue-list")
 def queue_list():
     """Get list of all queue items"""
-    with queue_lock:
-        items = list(download_queue.values())
+    items = [record for _, record in supervisor.iter_jobs(QUEUE_DIR)]
 
     # Sort by creation time, newest first
     items.sort(key=lambda x: x["created_at"], reverse=True)
@@ -109,20 +178,33 @@ def queue_list():
 @queue_bp.route("/queue-download-file/<queue_id>")
 def queue_download_file(queue_id):
     """Download the processed file"""
-    with queue_lock:
-        if queue_id not in download_queue:
-            return jsonify({"error": "Queue item not found"}), 404
+    item = _load_item(queue_id)
+    if item is None:
+        return jsonify({"error": "Queue item not found"}), 404
 
-        item = download_queue[queue_id]
+    if item["status"] == "expired":
+        return jsonify({"error": "Download expired"}), 410
 
-        if item["status"] != "completed":
-            return jsonify({"error": "Download not ready"}), 400
+    if item["status"] != "completed":
+        return jsonify({"error": "Download not ready"}), 400
 
-        file_path = item["file_path"]
+    # Hold off garbage collection until the file has been sent
+    job_dir = QUEUE_DIR / queue_id
+    serve_lock = storage.open_for_serving(job_dir)
+    item = _load_item(queue_id)
+    file_path = item["file_path"]
 
-    if not file_path or not os.path.exists(file_path):
+    # The collector may have evicted the output before the lock was taken
+    if item["status"] == "expired":
+        serve_lock.close()
+        return jsonify({"error": "Download expired"}), 410
+
+    if item["status"] != "completed" or not file_path or not os.path.exists(file_path):
+        serve_lock.close()
         return jsonify({"error": "File not found"}), 404
 
+    storage.mark_served(job_dir, item)
+
     def generate():
         with open(file_path, "rb") as f:
             while True:
@@ -132,13 +214,16 @@ def queue_download_file(queue_id):
                 yield chunk
 
     filename = os.path.basename(file_path)
-    return Response(
+    response = Response(
         generate(),
         headers={
             "Content-Type": "video/mp4",
             "Content-Disposition": f'attachment; filename="{filename}"',
         },
     )
+    # Runs even when the body is never sent, as for HEAD requests
+    response.call_on_close(serve_lock.close)
+    return response
 
 
 def _build_format_selector(quality):
@@ -169,6 +254,7 @@ def _build_ytdlp_command(url, quality, output_template):
             "-o",
             output_template,
             "--no-playlist",
+            "--newline",
             url,
         ]
     )
@@ -176,22 +262,40 @@ def _build_ytdlp_command(url, quality, output_template):
     return cmd
 
 
-def _monitor_download_progress(process, queue_id):
-    """Monitor download progress and update queue status."""
-    while True:
-        output = process.stdout.readline()
-        if output == "" and process.poll() is not None:
-            break
+def _record_progress(queue_id, line):
+    """Update queue progress from a yt-dlp output line."""
+    if "[download]" not in line or "%" not in line:
+        return
+
+    try:
+        # Extract progress percentage
+        progress_str = line.split("%")[0].split()[-1]
+        progress = float(progress_str)
+    except (ValueError, IndexError):
+        return
+
+    with queue_lock:
+        item = download_queue[queue_id]
+        persisted = int(item["progress"])
+        item["progress"] = progress
+
+    # Only write through whole-percent changes to keep disk writes bounded
+    if int(progress) != persisted:
+        _persist_item(queue_id)
 
-        if output and "[download]" in output and "%" in output:
-            try:
-                # Extract progress percentage
-                progress_str = output.split("%")[0].split()[-1]
-                progress = float(progress_str)
-                with queue_lock:
-                    download_queue[queue_id]["progress"] = progress
-            except (ValueError, IndexError):
-                pass
+
+def _check_cookie_rejection(output_dir):
+    """Discard the cached cookie jar if a failed job's log shows it was rejected"""
+    log_path = output_dir / supervisor.LOG_FILE
+    try:
+        with open(log_path, "rb") as f:
+            f.seek(max(log_path.stat().st_size - 65536, 0))
+            tail = f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return
+
+    if cookies.is_auth_failure(tail):
+        cookies.invalidate_cookie_jar()
 
 
 def _handle_download_completion(queue_id, return_code, output_dir):
@@ -204,57 +308,136 @@ def _handle_download_completion(queue_id, return_code, output_dir):
                 download_queue[queue_id]["status"] = "completed"
                 download_queue[queue_id]["progress"] = 100
                 download_queue[queue_id]["file_path"] = str(video_files[0])
+                download_queue[queue_id]["size"] = storage.output_size(output_dir)
+                download_queue[queue_id]["last_access"] = time.time()
             logging.info("Queue item %s completed successfully", queue_id)
         else:
             with queue_lock:
                 download_queue[queue_id]["status"] = "failed"
                 download_queue[queue_id]["error"] = "No video file found"
+    elif return_code is None:
+        with queue_lock:
+            download_queue[queue_id]["status"] = "failed"
+            download_queue[queue_id]["error"] = "Download interrupted"
     else:
         with queue_lock:
             download_queue[queue_id]["status"] = "failed"
             download_queue[queue_id]["error"] = "Download failed"
+        _check_cookie_rejection(output_dir)
+
+    _persist_item(queue_id)
 
 
 def process_queue_item(queue_id):
-    """Background worker to process a queue item"""
-    with queue_lock:
-        if queue_id not in download_queue:
+    """Background worker to process a queue item.
+
+    Starts the download, or reattaches to it if it is already running.
+    Returns straight away if another worker is supervising the job or it has
+    already finished.
+    """
+    output_dir = QUEUE_DIR / queue_id
+    output_dir.mkdir(exist_ok=True)
+
+    lock = supervisor.acquire_supervision(output_dir)
+    if lock is None:
+        # Another worker is already supervising this job
+        return
+
+    with lock:
+        # Another worker may have started or finished the job before the
+        # lock was taken, so go by the durable record rather than memory
+        record = supervisor.load_job(output_dir)
+        with queue_lock:
+            if record is not None:
+                download_queue[queue_id] = record
+            if queue_id not in download_queue:
+                return
+            item = download_queue[queue_id]
+            if item["status"] in supervisor.TERMINAL_STATES:
+                return
+            pid = item.get("pid")
+            if pid is None:
+                item["status"] = "processing"
+
+        timeline = JobTimeline.load(queue_id, "queue")
+        if pid is not None:
+            logging.info("Reattaching to queue item %s (pid %s)", queue_id, pid)
+            _supervise_download(queue_id, timeline, pid)
             return
-        item = download_queue[queue_id]
-        item["status"] = "processing"
 
-    try:
-        url = item["url"]
-        quality = item["quality"]
-
-        # Create output directory
-        output_dir = QUEUE_DIR / queue_id
-        output_dir.mkdir(exist_ok=True)
-
-        # Clean title for filename
-        safe_title = "".join(
-            c for c in item["title"] if c.isalnum() or c in (" ", "-", "_")
-        ).strip()[:50]
-        output_template = str(output_dir / f"{safe_title}.%(ext)s")
-
-        cmd = _build_ytdlp_command(url, quality, output_template)
-        logging.info("Processing queue item %s: %s", queue_id, " ".join(cmd))
-
-        # Run download and monitor progress
-        with subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            cwd=output_dir,
-        ) as process:
-            _monitor_download_progress(process, queue_id)
-            return_code = process.poll()
-
-        _handle_download_completion(queue_id, return_code, output_dir)
-
-    except (subprocess.SubprocessError, OSError, json.JSONDecodeError) as e:
-        logging.error("Queue processing error for %s: %s", queue_id, str(e))
-        with queue_lock:
-            download_queue[queue_id]["status"] = "failed"
-            download_queue[queue_id]["error"] = str(e)
+        try:
+            url = item["url"]
+            quality = item["quality"]
+
+            # Clean title for filename
+            safe_title = "".join(
+                c for c in item["title"] if c.isalnum() or c in (" ", "-", "_")
+            ).strip()[:50]
+            output_template = str(output_dir / f"{safe_title}.%(ext)s")
+
+            cmd = _build_ytdlp_command(url, quality, output_template)
+            logging.info("Processing queue item %s: %s", queue_id, " ".join(cmd))
+
+            # Run download detached so it survives worker recycling
+            timeline.start_phase("extraction")
+            process = supervisor.spawn_job(
+                cmd, output_dir, remove_after=cookies.job_jars(cmd)
+            )
+            with queue_lock:
+                item["pid"] = process.pid
+            _persist_item(queue_id)
+
+            _supervise_download(queue_id, timeline, process.pid, process=process)
+
+        except (subprocess.SubprocessError, OSError) as e:
+            logging.error("Queue processing error for %s: %s", queue_id, str(e))
+            with queue_lock:
+                download_queue[queue_id]["status"] = "failed"
+                download_queue[queue_id]["error"] = str(e)
+            _persist_item(queue_id)
+            timeline.finish("failed")
+
+
+def _supervise_download(queue_id, timeline, pid, process=None):
+    """Follow a running download to completion, tracking progress and phases"""
+    output_dir = QUEUE_DIR / queue_id
+
+    def on_output(line):
+        _record_progress(queue_id, line)
+        timeline.observe(line)
+
+    return_code = supervisor.wait_for_exit(
+        output_dir, pid, process=process, on_output=on_output
+    )
+    _handle_download_completion(queue_id, return_code, output_dir)
+
+    with queue_lock:
+        status = download_queue[queue_id]["status"]
+    timeline.finish(status)
+
+
+def resume_queue_item(queue_id, record):
+    """Carry an unfinished job on from its durable record until it finishes.
+
+    Returns straight away if another worker is already supervising it.
+    """
+    with queue_lock:
+        download_queue.setdefault(queue_id, record)
+
+    # Jobs that never got as far as spawning yt-dlp are started afresh,
+    # running ones are reattached to
+    process_queue_item(queue_id)
+
+
+def recover_queue():
+    """Reattach to or reconcile jobs left unfinished by a recycled worker"""
+    for job_dir, record in supervisor.iter_jobs(QUEUE_DIR):
+        if record["status"] in supervisor.TERMINAL_STATES:
+            continue
+        # These wait for a subscription download slot instead
+        if record.get("subscription"):
+            continue
+
+        threading.Thread(
+            target=resume_queue_item, args=(job_dir.name, record), daemon=True
+        ).start()
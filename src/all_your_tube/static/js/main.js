@@ -5,6 +5,21 @@ let autoScroll = true;
 let currentPid = null;
 let downloadCompleted = false;
 
+// Virtualized log view: lines are kept in a bounded ring buffer and only the
+// ones in view are rendered, once per animation frame however fast they arrive
+const LOG_MAX_LINES = 5000;
+const LOG_OVERSCAN_LINES = 10;
+const PROGRESS_LINE = /^\[download\]\s+\d+(\.\d+)?%/;
+
+const logBuffer = {
+    lines: new Array(LOG_MAX_LINES),
+    start: 0,
+    length: 0,
+};
+let logRenderRequested = false;
+let logHasNewLines = false;
+let latestStatus = null;
+
 // Initialize page
 document.addEventListener('DOMContentLoaded', function () {
     initializeFormValidation();
@@ -40,6 +55,7 @@ function initializeLogControls() {
 
     // Scroll detection for existing log.css behavior
     logs.addEventListener('scroll', function () {
+        scheduleLogRender();
         isUserScrolling = true;
         var isAtBottom = (logs.scrollTop + logs.offsetHeight) >= (logs.scrollHeight - 50);
 
@@ -97,9 +113,12 @@ function initializeLogControls() {
     }
 
     // Store references for use in other functions
+    window.addEventListener('resize', scheduleLogRender);
+
     window.logElements = {
         logs: logs,
         output: output,
+        logWindow: document.getElementById('outputWindow'),
         desc: desc,
         isUserScrolling: () => isUserScrolling,
         hasNewContent: hasNewContent,
@@ -121,6 +140,12 @@ function initializeFormSubmission() {
         queueHighQualityDownload();
     });
 
+    // Handle direct streaming button
+    document.getElementById('streamDownloadBtn').addEventListener('click', function (e) {
+        e.preventDefault();
+        streamDirectDownload();
+    });
+
     // Handle queue controls
     document.getElementById('hideQueue').addEventListener('click', function () {
         hideQueueSection();
@@ -227,26 +252,11 @@ function startLogStreaming(pid, subdir) {
     };
 
     eventSource.onmessage = function (event) {
-        const logs = window.logElements.logs;
-        const output = window.logElements.output;
-        const desc = window.logElements.desc;
-
-        // Check if user is at bottom before adding content (existing log.css behavior)
-        var wasAtBottom = (logs.scrollTop + logs.offsetHeight) >= (logs.scrollHeight - 10);
-
-        output.textContent += "\n" + event.data;
-
-        // Auto-scroll if enabled, user isn't scrolling (existing log.css behavior)
-        if (autoScroll && !window.logElements.isUserScrolling()) {
-            logs.scrollTop = logs.scrollHeight;
-        } else if (!wasAtBottom) {
-            // Show new content indicator if user has scrolled up
-            window.logElements.setHasNewContent(true);
-        }
+        appendLogLine(event.data);
 
         // Update description (existing log.css behavior)
         if (!event.data.includes("[download] Sleeping")) {
-            desc.textContent = "Status: " + event.data;
+            latestStatus = "Status: " + event.data;
         }
 
         // Handle completion (existing log.css behavior)
@@ -268,6 +278,82 @@ function startLogStreaming(pid, subdir) {
     };
 }
 
+function logBufferIndex(i) {
+    return (logBuffer.start + i) % LOG_MAX_LINES;
+}
+
+function appendLogLine(line) {
+    const lastIndex = logBufferIndex(logBuffer.length - 1);
+
+    // Progress updates replace the previous progress line in place
+    if (logBuffer.length > 0 && PROGRESS_LINE.test(line) &&
+        PROGRESS_LINE.test(logBuffer.lines[lastIndex])) {
+        logBuffer.lines[lastIndex] = line;
+    } else if (logBuffer.length < LOG_MAX_LINES) {
+        logBuffer.lines[logBufferIndex(logBuffer.length)] = line;
+        logBuffer.length++;
+    } else {
+        // Full: overwrite the oldest line
+        logBuffer.lines[logBuffer.start] = line;
+        logBuffer.start = logBufferIndex(1);
+    }
+
+    logHasNewLines = true;
+    scheduleLogRender();
+}
+
+function scheduleLogRender() {
+    if (!logRenderRequested) {
+        logRenderRequested = true;
+        requestAnimationFrame(renderLogs);
+    }
+}
+
+function renderLogs() {
+    logRenderRequested = false;
+
+    const logs = window.logElements.logs;
+    const output = window.logElements.output;
+    const logWindow = window.logElements.logWindow;
+    const lineHeight = parseFloat(getComputedStyle(logWindow).lineHeight);
+
+    if (logHasNewLines) {
+        logHasNewLines = false;
+
+        // Check if user is at bottom before adding content (existing log.css behavior)
+        const wasAtBottom = (logs.scrollTop + logs.offsetHeight) >= (logs.scrollHeight - 10);
+
+        // Size the spacer for the whole log so the scrollbar stays accurate
+        output.style.height = (logBuffer.length * lineHeight) + 'px';
+
+        // Auto-scroll if enabled, user isn't scrolling (existing log.css behavior)
+        if (autoScroll && !window.logElements.isUserScrolling()) {
+            logs.scrollTop = logs.scrollHeight;
+        } else if (!wasAtBottom) {
+            // Show new content indicator if user has scrolled up
+            window.logElements.setHasNewContent(true);
+        }
+    }
+
+    if (latestStatus !== null) {
+        window.logElements.desc.textContent = latestStatus;
+        latestStatus = null;
+    }
+
+    // Render only the lines in view, plus a few either side
+    const offset = Math.max(0, logs.scrollTop - output.offsetTop);
+    const first = Math.max(0, Math.floor(offset / lineHeight) - LOG_OVERSCAN_LINES);
+    const visibleLines = Math.ceil(logs.clientHeight / lineHeight) + 2 * LOG_OVERSCAN_LINES;
+    const last = Math.min(logBuffer.length, first + visibleLines);
+
+    const lines = [];
+    for (let i = first; i < last; i++) {
+        lines.push(logBuffer.lines[logBufferIndex(i)]);
+    }
+    logWindow.style.transform = `translateY(${first * lineHeight}px)`;
+    logWindow.textContent = lines.join('\n');
+}
+
 function setSubmitButtonRunning() {
     const submitButton = document.querySelector('#downloadForm button[type="submit"]');
     submitButton.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Running...';
@@ -287,6 +373,9 @@ function showLoggingSection() {
     section.style.display = 'block';
     desc.textContent = "Status: Starting...";
     section.scrollIntoView({ behavior: 'smooth' });
+
+    // The log view can only work out what is in view once it is shown
+    scheduleLogRender();
 }
 
 function updateConnectionStatus(status, text) {
@@ -391,6 +480,22 @@ function queueHighQualityDownload() {
         });
 }
 
+// Stream a single-file format straight to the browser without a server copy
+function streamDirectDownload() {
+    const urlInput = document.getElementById('url');
+
+    if (!urlInput.value) {
+        showError('Please enter a video URL');
+        return;
+    }
+
+    const urlPrefix = window.URL_PREFIX || '';
+    const params = new URLSearchParams({ url: urlInput.value, quality: 'best' });
+
+    // The attachment response downloads in place without leaving the page
+    window.location.assign(`${urlPrefix}/stream-download?${params}`);
+}
+
 function showQueueSection() {
     const section = document.getElementById('queueSection');
     section.style.display = 'block';
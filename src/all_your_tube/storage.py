@@ -0,0 +1,164 @@
+"""
+Garbage collection of queue download outputs.
+
+Completed queue jobs record the size of their output and when it was last
+accessed. A background collector evicts outputs that have not been touched
+for a TTL since they were served, then evicts in least recently used order
+while the total exceeds a byte quota. Outputs being served hold a shared lock
+and are never evicted, nor are outputs queued to be kept, such as archives
+from bulk ingest.
+"""
+
+import fcntl
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from . import supervisor, timeline
+
+# Byte quota for completed queue outputs, 0 for no quota
+QUEUE_QUOTA_BYTES = int(os.environ.get("AYT_QUEUE_QUOTA_BYTES", 0))
+# Seconds an output is kept after it was last served, 0 to keep forever
+QUEUE_TTL = int(os.environ.get("AYT_QUEUE_TTL", 24 * 60 * 60))
+GC_INTERVAL = int(os.environ.get("AYT_GC_INTERVAL", 60))
+
+# Evict at most this many outputs per pass to keep each pass short
+GC_BATCH = 20
+
+SERVE_LOCK_FILE = ".serve.lock"
+GC_LOCK_FILE = ".gc.lock"
+
+# Files that describe the job rather than being part of its output
+JOB_METADATA_FILES = (
+    supervisor.JOB_FILE,
+    supervisor.LOG_FILE,
+    supervisor.EXIT_FILE,
+    supervisor.LOCK_FILE,
+    SERVE_LOCK_FILE,
+)
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def output_size(job_dir):
+    """Total size in bytes of a job's output files"""
+    return sum(
+        path.stat().st_size
+        for path in Path(job_dir).iterdir()
+        if path.is_file() and path.name not in JOB_METADATA_FILES
+    )
+
+
+def open_for_serving(job_dir):
+    """Take a shared lock that keeps the collector away from a job's output.
+
+    The returned file must stay open until the output has been sent.
+    """
+    # pylint: disable=consider-using-with
+    lock = open(Path(job_dir) / SERVE_LOCK_FILE, "a", encoding="utf-8")
+    fcntl.flock(lock, fcntl.LOCK_SH)
+    return lock
+
+
+def mark_served(job_dir, record):
+    """Record that a job's output was just served"""
+    now = time.time()
+    record["served_at"] = now
+    record["last_access"] = now
+    supervisor.save_job(job_dir, record)
+
+
+def _evict(job_dir, last_access, reason):
+    """Delete a job's output unless it is being served; True if evicted"""
+    with open(Path(job_dir) / SERVE_LOCK_FILE, "a", encoding="utf-8") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        # Re-read under the lock in case it was served in the meantime
+        record = supervisor.load_job(job_dir)
+        if record is None or record["status"] != "completed":
+            return False
+        if record.get("last_access", last_access) != last_access:
+            return False
+
+        for path in Path(job_dir).iterdir():
+            if path.is_file() and path.name not in JOB_METADATA_FILES:
+                path.unlink()
+
+        record["status"] = "expired"
+        record["file_path"] = None
+        record["size"] = 0
+        record["expired_at"] = datetime.now().isoformat()
+        supervisor.save_job(job_dir, record)
+        timeline.delete_timeline(Path(job_dir).name)
+
+    logger.info("Evicted queue output %s (%s)", Path(job_dir).name, reason)
+    return True
+
+
+def _completed_outputs(queue_dir):
+    """Return (job_dir, record) for completed jobs, least recently used first"""
+    outputs = []
+    for job_dir, record in supervisor.iter_jobs(queue_dir):
+        if record["status"] != "completed" or record.get("keep"):
+            continue
+        if record.get("size") is None:
+            record["size"] = output_size(job_dir)
+        if record.get("last_access") is None:
+            record["last_access"] = (job_dir / supervisor.JOB_FILE).stat().st_mtime
+        outputs.append((job_dir, record))
+
+    outputs.sort(key=lambda output: output[1]["last_access"])
+    return outputs
+
+
+def collect_garbage(queue_dir):
+    """Run one bounded eviction pass; returns the number of outputs evicted"""
+    now = time.time()
+    evicted = 0
+    remaining = []
+
+    for job_dir, record in _completed_outputs(queue_dir):
+        served = record.get("served_at") is not None
+        if (
+            QUEUE_TTL
+            and served
+            and now - record["last_access"] > QUEUE_TTL
+            and evicted < GC_BATCH
+            and _evict(job_dir, record["last_access"], "ttl")
+        ):
+            evicted += 1
+        else:
+            remaining.append((job_dir, record))
+
+    if QUEUE_QUOTA_BYTES:
+        total = sum(record["size"] for _, record in remaining)
+        for job_dir, record in remaining:
+            if total <= QUEUE_QUOTA_BYTES or evicted >= GC_BATCH:
+                break
+            if _evict(job_dir, record["last_access"], "quota"):
+                total -= record["size"]
+                evicted += 1
+
+    return evicted
+
+
+def start_collector(queue_dir):
+    """Run the collector in the background of this worker.
+
+    Every worker starts one, but only one pass runs at a time across them.
+    """
+    if not QUEUE_QUOTA_BYTES and not QUEUE_TTL:
+        return
+
+    supervisor.start_periodic_task(
+        GC_INTERVAL,
+        Path(queue_dir) / GC_LOCK_FILE,
+        lambda: collect_garbage(queue_dir),
+        "Queue garbage collection",
+    )
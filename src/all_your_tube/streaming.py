@@ -0,0 +1,163 @@
+"""
+Direct-to-client downloads streamed from yt-dlp's stdout.
+
+Single-file formats need no merging, so yt-dlp can write them to stdout with
+``-o -`` and the bytes are relayed to the client as they arrive. Nothing is
+written to disk on the server and the first byte reaches the client as soon
+as yt-dlp starts downloading.
+"""
+
+import logging
+import mimetypes
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+from flask import Blueprint, Response, jsonify, request
+from ulid import ULID
+
+from . import cookies
+from .timeline import JobTimeline
+from .utils import get_cookies, validate_input
+
+CHUNK_SIZE = 64 * 1024
+
+# Create blueprint for streaming routes
+streaming_bp = Blueprint("streaming", __name__)
+
+
+def _build_single_file_selector(quality):
+    """Build a yt-dlp format selector that never needs a merge."""
+    if quality == "best":
+        return "best[ext=mp4]/best"
+    height_limit = quality.replace("p", "")
+    return f"best[height<={height_limit}][ext=mp4]/best[height<={height_limit}]"
+
+
+def _build_stream_command(url, quality, name_file):
+    """Build yt-dlp command arguments that write the media to stdout."""
+    cmd = ["yt-dlp"]
+    cookie_args = get_cookies()
+    if cookie_args:
+        cmd.extend(cookie_args.split())
+
+    cmd.extend(
+        [
+            "-f",
+            _build_single_file_selector(quality),
+            "--no-playlist",
+            # Record the filename before the download starts for the headers
+            "--print-to-file",
+            "before_dl:%(title)s.%(ext)s",
+            name_file,
+            "-o",
+            "-",
+            url,
+        ]
+    )
+    return cmd
+
+
+def _read_filename(name_file):
+    """Read the filename yt-dlp printed, made safe for a header."""
+    try:
+        name = Path(name_file).read_text(encoding="utf-8").strip()
+    except OSError:
+        name = ""
+
+    stem, _, ext = name.rpartition(".")
+    safe_stem = "".join(
+        c for c in stem if c.isascii() and (c.isalnum() or c in (" ", "-", "_"))
+    ).strip()[:100]
+    safe_ext = "".join(c for c in ext if c.isascii() and c.isalnum()) or "mp4"
+    return f"{safe_stem or 'video'}.{safe_ext}"
+
+
+def _read_error(stderr_file):
+    """Return the tail of yt-dlp's stderr."""
+    stderr_file.seek(0)
+    return stderr_file.read()[-4096:].decode("utf-8", errors="replace")
+
+
+def _stream_response(process, first_chunk, filename, stderr_file, timeline):
+    """Relay the rest of yt-dlp's stdout, cleaning up once the response closes"""
+    result = {"status": "failed"}
+
+    def generate():
+        yield first_chunk
+        while True:
+            chunk = process.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        if process.wait() == 0:
+            result["status"] = "completed"
+
+    def cleanup():
+        # The body may never be sent, as for HEAD requests, or the client
+        # may have gone away mid-stream
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        stderr_file.close()
+        cookies.release_job_jars(process.args)
+        timeline.finish(result["status"])
+
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = Response(
+        generate(),
+        headers={
+            "Content-Type": content_type,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
+    response.call_on_close(cleanup)
+    return response
+
+
+@streaming_bp.route("/stream-download")
+def stream_download():
+    """Stream a single-file video straight from yt-dlp to the client"""
+    url = request.args.get("url")
+    quality = request.args.get("quality", "best")  # best, 1080p, 720p, etc.
+
+    if not url or not validate_input(url):
+        return jsonify({"error": "Invalid URL"}), 400
+
+    stream_id = str(ULID())
+    timeline = JobTimeline(stream_id, "stream", url=url, quality=quality)
+    timeline.start_phase("extraction")
+
+    name_fd, name_file = tempfile.mkstemp(prefix="ayt-stream-")
+    os.close(name_fd)
+    # pylint: disable=consider-using-with
+    stderr_file = tempfile.TemporaryFile()
+
+    cmd = _build_stream_command(url, quality, name_file)
+    logging.info("Streaming %s: %s", stream_id, " ".join(cmd))
+
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+
+    # Headers can only be sent once yt-dlp has resolved the video, which is
+    # also when the first bytes arrive
+    first_chunk = process.stdout.read1(CHUNK_SIZE)
+    filename = _read_filename(name_file)
+    os.unlink(name_file)
+
+    if not first_chunk:
+        process.wait()
+        error = _read_error(stderr_file)
+        stderr_file.close()
+        cookies.release_job_jars(cmd)
+        logging.error("Streaming %s failed: %s", stream_id, error)
+        if cookies.is_auth_failure(error):
+            cookies.invalidate_cookie_jar()
+        timeline.finish("failed")
+        return jsonify({"error": "Failed to stream video"}), 400
+
+    timeline.start_phase("download")
+    return _stream_response(process, first_chunk, filename, stderr_file, timeline)
@@ -0,0 +1,390 @@
+"""
+Channel and playlist subscriptions.
+
+A subscription is a channel or playlist URL that is checked periodically in
+the background. Each check lists the channel flat, newest first, and stops
+as soon as it reaches a video it has already seen, so a check costs only as
+much as there are new uploads. Playlists add new videos at the end instead,
+so only their last entries are listed and read from the end. New videos are
+sent through the download queue.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+from ulid import ULID
+
+from . import cookies, queue, supervisor
+from .utils import get_cookies, validate_input
+
+# Seconds between checks of each subscription
+SUBSCRIPTION_INTERVAL = int(os.environ.get("AYT_SUBSCRIPTION_INTERVAL", 60 * 60))
+# Most new videos a single check will queue
+SUBSCRIPTION_MAX_NEW = int(os.environ.get("AYT_SUBSCRIPTION_MAX_NEW", 50))
+# Subscription downloads that may run at once across all workers
+SUBSCRIPTION_CONCURRENCY = int(os.environ.get("AYT_SUBSCRIPTION_CONCURRENCY", 1))
+
+SCHEDULER_INTERVAL = 60
+DOWNLOAD_POLL_INTERVAL = 10
+LISTING_TIMEOUT = 300
+# Recent video IDs kept per subscription, so a deleted video still leaves
+# others to stop at
+SEEN_HISTORY = 50
+# Checks that may fail to queue a video before it is skipped
+MAX_ATTEMPTS = 3
+
+SUBSCRIPTION_DIR = queue.WORKDIR / "subscriptions"
+CHECK_LOCK_FILE = ".check.lock"
+DOWNLOAD_SLOT_FILE = ".download-{}.lock"
+
+# Create blueprint for subscription routes
+subscriptions_bp = Blueprint("subscriptions", __name__)
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def _subscription_path(subscription_id):
+    """Return where a subscription is stored"""
+    return SUBSCRIPTION_DIR / f"{subscription_id}.json"
+
+
+def save_subscription(record):
+    """Atomically write a subscription to disk"""
+    SUBSCRIPTION_DIR.mkdir(parents=True, exist_ok=True)
+    path = _subscription_path(record["id"])
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def load_subscription(subscription_id):
+    """Read a subscription, returning None if there is none"""
+    try:
+        with open(_subscription_path(subscription_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def iter_subscriptions():
+    """Yield every saved subscription, oldest first"""
+    if not SUBSCRIPTION_DIR.exists():
+        return
+    for path in sorted(SUBSCRIPTION_DIR.glob("*.json")):
+        record = load_subscription(path.stem)
+        if record is not None:
+            yield record
+
+
+def create_subscription(url, quality, backfill=0):
+    """Register a channel or playlist URL and return its record.
+
+    The first check queues the ``backfill`` most recent videos; anything
+    older is treated as already seen.
+    """
+    record = {
+        "id": str(ULID()),
+        "url": url,
+        "quality": quality,
+        "backfill": backfill,
+        "created_at": datetime.now().isoformat(),
+        "last_checked": None,
+        "seen_ids": [],
+        "queued": 0,
+        "retry": [],
+        "error": None,
+    }
+    save_subscription(record)
+    logger.info("Subscribed %s to %s", record["id"], url)
+    return record
+
+
+def _lists_newest_last(url):
+    """Check whether a URL is a playlist, which lists its newest videos last.
+
+    Channel tabs list uploads newest first, but playlists keep the order they
+    were put together in, with videos added at the end.
+    """
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    return "list" in query
+
+
+def _build_listing_command(url, limit, newest_last=False):
+    """Build a yt-dlp command that lists a playlist's entries without resolving them"""
+    if newest_last:
+        # Only the end of the playlist can hold new videos
+        selection = ["--playlist-items", f"-{limit}:"]
+    else:
+        # Emit entries as pages arrive so the listing can stop early
+        selection = ["--lazy-playlist", "--playlist-end", str(limit)]
+
+    return [
+        "yt-dlp",
+        *get_cookies().split(),
+        "--flat-playlist",
+        *selection,
+        "--print",
+        "%(.{id,url,webpage_url,title})j",
+        url,
+    ]
+
+
+def read_new_entries(lines, seen_ids, limit):
+    """Collect entries from listing output until a seen video is reached.
+
+    Returns the entries and whether reading stopped before the output ended.
+    """
+    seen = set(seen_ids)
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if entry.get("id") in seen or len(entries) >= limit:
+            return entries, True
+        entries.append(entry)
+    return entries, False
+
+
+def list_new_entries(record):
+    """List a subscription's videos newer than the last seen, newest first"""
+    seen_ids = record["seen_ids"]
+    # With nothing seen yet, the newest video is enough to start from
+    limit = SUBSCRIPTION_MAX_NEW if seen_ids else max(record["backfill"], 1)
+
+    newest_last = _lists_newest_last(record["url"])
+    cmd = _build_listing_command(record["url"], limit, newest_last)
+    logger.debug("Listing subscription %s: %s", record["id"], " ".join(cmd))
+
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    timer = threading.Timer(LISTING_TIMEOUT, process.kill)
+    timer.start()
+    try:
+        if newest_last:
+            # The newest videos come last, so the whole listing is needed
+            output, stderr = process.communicate()
+            entries, _ = read_new_entries(
+                reversed(output.splitlines()), seen_ids, limit
+            )
+            stopped_early = False
+        else:
+            entries, stopped_early = read_new_entries(process.stdout, seen_ids, limit)
+            # Stop yt-dlp fetching further pages once the last seen video is found
+            if stopped_early:
+                process.kill()
+            _, stderr = process.communicate()
+    finally:
+        timer.cancel()
+        cookies.release_job_jars(cmd)
+
+    # A listing cut short by an error would skip past unlisted videos
+    if not stopped_early and process.returncode != 0:
+        raise RuntimeError(stderr.strip()[-500:] or "Listing failed")
+    return entries
+
+
+def _entry_url(entry):
+    """Get the URL to download a listed entry from"""
+    return entry.get("webpage_url") or entry.get("url")
+
+
+def _queue_video(record, url):
+    """Add a video to the download queue; True if it was queued"""
+    try:
+        # Mirrored videos are kept out of quota and TTL eviction
+        item = queue.enqueue(
+            url, record["quality"], keep=True, subscription=record["id"]
+        )
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.warning("Could not queue %s from %s: %s", url, record["id"], e)
+        return False
+
+    if item is None:
+        logger.warning("Could not queue %s from %s", url, record["id"])
+        return False
+    return True
+
+
+def _retry_failed(record):
+    """Try again to queue videos that failed on earlier checks"""
+    queued = 0
+    retry = []
+    for failed in record.get("retry", []):
+        if _queue_video(record, failed["url"]):
+            queued += 1
+        elif failed["attempts"] + 1 < MAX_ATTEMPTS:
+            retry.append(failed | {"attempts": failed["attempts"] + 1})
+        else:
+            logger.error("Giving up on %s from %s", failed["url"], record["id"])
+    record["retry"] = retry
+    return queued
+
+
+def check_subscription(record):
+    """Queue a subscription's new videos; returns how many were queued"""
+    queued = _retry_failed(record)
+    entries = list_new_entries(record)
+
+    # On the first check, videos past the backfill only mark where to start
+    to_queue = len(entries) if record["seen_ids"] else record["backfill"]
+    done = set(range(to_queue, len(entries)))
+    failed = []
+
+    # Oldest first, so the queue follows upload order
+    for index in reversed(range(min(to_queue, len(entries)))):
+        url = _entry_url(entries[index])
+        if not url or not validate_input(url):
+            done.add(index)
+        elif _queue_video(record, url):
+            done.add(index)
+            queued += 1
+        else:
+            failed.append(index)
+
+    # Listing stops at the newest video recorded as seen, so failures newer
+    # than that are listed again next time and older ones need retrying
+    newest_done = min(done, default=len(entries))
+    record["retry"] += [
+        {"url": _entry_url(entries[index]), "attempts": 1}
+        for index in failed
+        if index > newest_done
+    ]
+
+    new_ids = [entry["id"] for entry in entries[newest_done:] if entry.get("id")]
+    record["seen_ids"] = (new_ids + record["seen_ids"])[:SEEN_HISTORY]
+    record["queued"] += queued
+    return queued
+
+
+def check_due_subscriptions():
+    """Check every subscription whose interval has passed"""
+    now = time.time()
+    for record in iter_subscriptions():
+        if record["last_checked"] and now - record["last_checked"] < (
+            SUBSCRIPTION_INTERVAL
+        ):
+            continue
+
+        try:
+            queued = check_subscription(record)
+            record["error"] = None
+            logger.info("Subscription %s queued %d videos", record["id"], queued)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            record["error"] = str(e)
+            logger.exception("Checking subscription %s failed", record["id"])
+        record["last_checked"] = time.time()
+
+        # Do not bring back a subscription removed during the check
+        if _subscription_path(record["id"]).exists():
+            save_subscription(record)
+
+
+def _pending_downloads():
+    """Yield the queue IDs of unfinished subscription videos, oldest first"""
+    for job_dir, record in supervisor.iter_jobs(queue.QUEUE_DIR):
+        if (
+            record.get("subscription")
+            and record["status"] not in supervisor.TERMINAL_STATES
+        ):
+            yield job_dir.name
+
+
+def run_pending_downloads(slot):
+    """Download waiting subscription videos while holding a download slot.
+
+    The slots are locks shared by every worker, so at most
+    SUBSCRIPTION_CONCURRENCY videos download at once however many workers
+    there are, or have been recycled. Returns straight away if another
+    worker holds the slot.
+    """
+    SUBSCRIPTION_DIR.mkdir(parents=True, exist_ok=True)
+    slot_path = SUBSCRIPTION_DIR / DOWNLOAD_SLOT_FILE.format(slot)
+    with open(slot_path, "a", encoding="utf-8") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        # Videos another slot is already downloading are skipped at once
+        for queue_id in _pending_downloads():
+            try:
+                queue.process_queue_item(queue_id)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Subscription download %s failed", queue_id)
+
+
+def _download_worker(slot):
+    """Keep taking waiting subscription videos through one download slot"""
+    while True:
+        time.sleep(DOWNLOAD_POLL_INTERVAL)
+        try:
+            run_pending_downloads(slot)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Running subscription downloads failed")
+
+
+def start_scheduler():
+    """Check subscriptions in the background of this worker.
+
+    Every worker starts one, but only one check runs at a time across them.
+    New videos wait in the queue directory and are downloaded through a
+    fixed number of slots, so a large backfill does not start every
+    download at once, even when a recycled worker recovers the queue.
+    """
+    for slot in range(max(SUBSCRIPTION_CONCURRENCY, 1)):
+        threading.Thread(target=_download_worker, args=(slot,), daemon=True).start()
+
+    supervisor.start_periodic_task(
+        SCHEDULER_INTERVAL,
+        SUBSCRIPTION_DIR / CHECK_LOCK_FILE,
+        check_due_subscriptions,
+        "Checking subscriptions",
+    )
+
+
+@subscriptions_bp.route("/subscriptions", methods=["POST"])
+def subscribe():
+    """Subscribe to a channel or playlist"""
+    url = request.form.get("url")
+    quality = request.form.get("quality", "best")  # best, 1080p, 720p, etc.
+
+    if not url or not validate_input(url):
+        return jsonify({"error": "Invalid URL"}), 400
+
+    try:
+        backfill = max(int(request.form.get("backfill", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "Invalid backfill"}), 400
+
+    return jsonify(create_subscription(url, quality, backfill)), 201
+
+
+@subscriptions_bp.route("/subscriptions")
+def subscription_list():
+    """Get list of all subscriptions"""
+    return jsonify({"items": list(iter_subscriptions())})
+
+
+@subscriptions_bp.route("/subscriptions/<subscription_id>", methods=["DELETE"])
+def unsubscribe(subscription_id):
+    """Remove a subscription"""
+    if not subscription_id.isalnum() or load_subscription(subscription_id) is None:
+        return jsonify({"error": "Subscription not found"}), 404
+
+    _subscription_path(subscription_id).unlink(missing_ok=True)
+    logger.info("Unsubscribed %s", subscription_id)
+    return jsonify({"success": True})
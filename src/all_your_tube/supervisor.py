@@ -0,0 +1,257 @@
+"""
+Durable supervision of background yt-dlp jobs.
+
+Each job keeps its state in ``job.json`` inside its own directory and runs
+yt-dlp detached from the worker that launched it. When gunicorn recycles that
+worker mid-download, the next worker to start reattaches to the running child
+or reconciles the final state from the recorded exit status and output files.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shlex
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+JOB_FILE = "job.json"
+LOG_FILE = "job.log"
+EXIT_FILE = "exit_status"
+LOCK_FILE = ".supervisor.lock"
+
+TERMINAL_STATES = ("completed", "failed", "expired")
+
+# How often background tasks check whether they are due
+PERIODIC_CHECK_INTERVAL = 60
+
+# Get logger for this module
+logger = logging.getLogger(__name__)
+
+
+def save_job(job_dir, record):
+    """Atomically write a job record into its directory"""
+    job_dir = Path(job_dir)
+    tmp_path = job_dir / f".{JOB_FILE}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, job_dir / JOB_FILE)
+
+
+def load_job(job_dir):
+    """Read a job record, returning None if it is missing or unreadable"""
+    try:
+        with open(Path(job_dir) / JOB_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def iter_jobs(root):
+    """Yield (job_dir, record) for every job directory under root"""
+    for job_dir in sorted(Path(root).iterdir()):
+        if not job_dir.is_dir():
+            continue
+        record = load_job(job_dir)
+        if record is not None:
+            yield job_dir, record
+
+
+def spawn_job(cmd, job_dir, remove_after=()):
+    """Start cmd in its own session, logging and recording its exit status.
+
+    The shell wrapper writes the exit status next to the log once yt-dlp
+    finishes and deletes the ``remove_after`` files, so both happen even if
+    the supervising worker is gone.
+    """
+    job_dir = Path(job_dir)
+    (job_dir / EXIT_FILE).unlink(missing_ok=True)
+    script = f"{shlex.join(cmd)} > {LOG_FILE} 2>&1; echo $? > {EXIT_FILE}"
+    if remove_after:
+        script += f"; rm -f -- {shlex.join(str(path) for path in remove_after)}"
+
+    # pylint: disable=consider-using-with
+    return subprocess.Popen(
+        ["/bin/bash", "-c", script],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        cwd=job_dir,
+    )
+
+
+def read_exit_status(job_dir):
+    """Return the recorded exit status, or None if none was written"""
+    try:
+        content = (Path(job_dir) / EXIT_FILE).read_text(encoding="utf-8").strip()
+        return int(content)
+    except (OSError, ValueError):
+        return None
+
+
+def job_running(pid, job_dir):
+    """Check that pid is alive and is still the shell started for job_dir"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    if not Path("/proc/self").exists():
+        return True
+
+    # Orphans are not reaped when PID 1 is not an init, so a job that has
+    # exited can linger as a zombie; guard against PID reuse as well
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text(encoding="utf-8")
+        if stat.rpartition(")")[2].split()[0] == "Z":
+            return False
+        return Path(os.readlink(f"/proc/{pid}/cwd")) == Path(job_dir).resolve()
+    except (OSError, IndexError):
+        return False
+
+
+def acquire_supervision(job_dir):
+    """Take the job's supervisor lock without blocking.
+
+    Returns the open lock file, which must be kept open for as long as the
+    job is supervised, or None when another worker already owns the job. The
+    lock is released by the OS if the owning worker dies.
+    """
+    # pylint: disable=consider-using-with
+    lock = open(Path(job_dir) / LOCK_FILE, "a", encoding="utf-8")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def run_periodic_task(interval, lock_path, task, name):
+    """Run task once if it is due and no other worker is running it.
+
+    The last run is recorded next to the lock, so recycled workers neither
+    repeat nor postpone it. Returns True if the task ran.
+    """
+    lock_path = Path(lock_path)
+    stamp_path = lock_path.with_suffix(".last")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a", encoding="utf-8") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        try:
+            last_run = stamp_path.stat().st_mtime
+        except FileNotFoundError:
+            last_run = 0
+        if time.time() - last_run < interval:
+            return False
+
+        try:
+            task()
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("%s failed", name)
+        stamp_path.touch()
+        return True
+
+
+def start_periodic_task(interval, lock_path, task, name):
+    """Run task every interval seconds in the background of this worker.
+
+    Every worker may start one, but a lock on lock_path makes sure only one
+    of them runs the task at a time.
+    """
+
+    def run():
+        while True:
+            time.sleep(min(interval, PERIODIC_CHECK_INTERVAL))
+            try:
+                run_periodic_task(interval, lock_path, task, name)
+            except OSError:
+                logger.exception("%s could not be scheduled", name)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _read_complete_lines(f):
+    """Read whole lines from f, leaving any partial trailing line unread"""
+    lines = []
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line.endswith("\n"):
+            f.seek(position)
+            return lines
+        lines.append(line.rstrip("\n\r"))
+
+
+def follow_log(log_path, is_running, on_output, poll_interval=1.0, from_end=False):
+    """Pass each complete line of a growing log to on_output.
+
+    With ``from_end`` only lines written after the log is first opened are
+    passed on. Returns once ``is_running()`` is false and the log has been
+    drained.
+    """
+    log_path = Path(log_path)
+    log = None
+
+    def drain():
+        nonlocal log
+        if log is None:
+            if not log_path.exists():
+                return
+            # pylint: disable=consider-using-with
+            log = open(log_path, "r", encoding="utf-8", errors="replace")
+            if from_end:
+                log.seek(0, os.SEEK_END)
+        for line in _read_complete_lines(log):
+            on_output(line)
+
+    try:
+        while True:
+            drain()
+            if not is_running():
+                break
+            time.sleep(poll_interval)
+
+        drain()
+    finally:
+        if log is not None:
+            log.close()
+
+
+def wait_for_exit(job_dir, pid, process=None, on_output=None, poll_interval=1.0):
+    """Follow a job's log until its process exits.
+
+    ``process`` is the Popen when this worker spawned the job, so it can be
+    reaped; reattached jobs are tracked by PID instead and only output written
+    after reattaching is passed to ``on_output``. Returns the recorded exit
+    status, or None if the job died without recording one.
+    """
+    job_dir = Path(job_dir)
+
+    def is_running():
+        if process is not None:
+            return process.poll() is None
+        # The recorded status is final even if the shell lingers as a zombie
+        return read_exit_status(job_dir) is None and job_running(pid, job_dir)
+
+    follow_log(
+        job_dir / LOG_FILE,
+        is_running,
+        on_output or (lambda line: None),
+        poll_interval=poll_interval,
+        from_end=process is None,
+    )
+
+    return_code = read_exit_status(job_dir)
+    if return_code is None:
+        logger.warning("Job in %s exited without recording a status", job_dir)
+    return return_code
@@ -0,0 +1,286 @@
+"""
+Per-job phase timelines for downloads.
+
+Each job records when it entered phases such as queue wait, metadata probe,
+extraction, media transfer, merge and thumbnail embedding, mostly by watching
+the markers yt-dlp prints. Timelines are served per job and pruned once they
+are old. If a trace file is configured, finished jobs are also appended to it
+as OTLP/JSON spans so slow phases can be aggregated across many jobs by any
+OpenTelemetry collector.
+"""
+
+import fcntl
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+
+from flask import Blueprint, jsonify
+
+from . import supervisor
+
+# Get WORKDIR from environment
+WORKDIR = os.environ.get("AYT_WORKDIR")
+if not WORKDIR:
+    raise RuntimeError("AYT_WORKDIR env variable must be set")
+WORKDIR = Path(WORKDIR)
+
+TIMELINE_DIR = WORKDIR / "logs" / "timelines"
+# Span export is opt-in, as the file grows by one line per job
+TRACE_FILE = os.environ.get("AYT_TRACE_FILE", "")
+# Seconds a finished timeline is kept, 0 to keep forever
+TIMELINE_TTL = int(os.environ.get("AYT_TIMELINE_TTL", 7 * 24 * 60 * 60))
+
+PRUNE_INTERVAL = 60 * 60
+PRUNE_LOCK_FILE = ".prune.lock"
+
+SERVICE_NAME = "all-your-tube"
+
+# yt-dlp prefixes its output with the name of the component doing the work;
+# any marker not listed here is an extractor working on the URL
+MARKER_PATTERN = re.compile(r"^\[(\w+)\]")
+IGNORED_MARKERS = ("debug",)
+PHASE_MARKERS = {
+    "download": ("download", "hlsnative", "dashsegments", "http", "Aria2c"),
+    "merge": ("Merger",),
+    "thumbnail": ("EmbedThumbnail", "ThumbnailsConvertor"),
+    "post_process": (
+        "ExtractAudio",
+        "FixupDuration",
+        "FixupM3u8",
+        "FixupM4a",
+        "FixupStretched",
+        "FixupTimestamp",
+        "Metadata",
+        "ModifyChapters",
+        "MoveFiles",
+        "SplitChapters",
+        "SponsorBlock",
+        "VideoConvertor",
+        "VideoRemuxer",
+    ),
+}
+PHASE_BY_MARKER = {
+    marker: phase for phase, markers in PHASE_MARKERS.items() for marker in markers
+}
+
+# Create blueprint for timeline routes
+timeline_bp = Blueprint("timeline", __name__)
+
+
+def phase_for_line(line):
+    """Map a yt-dlp output line to the phase it indicates, if any"""
+    match = MARKER_PATTERN.match(line)
+    if not match or match.group(1) in IGNORED_MARKERS:
+        return None
+
+    marker = match.group(1)
+    if marker == "info" and "thumbnail" in line:
+        return "thumbnail"
+    return PHASE_BY_MARKER.get(marker, "extraction")
+
+
+def _timeline_path(job_id):
+    """Return where the timeline for job_id is stored"""
+    return TIMELINE_DIR / f"{job_id}.json"
+
+
+class JobTimeline:
+    """Record the phases a single job passes through"""
+
+    def __init__(self, job_id, kind, **attributes):
+        self.record = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": "running",
+            "started_at": time.time(),
+            "finished_at": None,
+            "attributes": attributes,
+            "phases": [],
+        }
+
+    @classmethod
+    def load(cls, job_id, kind):
+        """Resume a saved timeline, or start a new one if there is none"""
+        timeline = cls(job_id, kind)
+        record = load_timeline(job_id)
+        if record is not None:
+            timeline.record = record
+        return timeline
+
+    @property
+    def current_phase(self):
+        """Name of the phase in progress, if any"""
+        phases = self.record["phases"]
+        if phases and phases[-1]["end"] is None:
+            return phases[-1]["name"]
+        return None
+
+    def _end_phase(self, now):
+        """Close the phase in progress, if any"""
+        phases = self.record["phases"]
+        if phases and phases[-1]["end"] is None:
+            phases[-1]["end"] = now
+
+    def start_phase(self, name):
+        """End the current phase and start a new one"""
+        if name == self.current_phase:
+            return
+        now = time.time()
+        self._end_phase(now)
+        self.record["phases"].append({"name": name, "start": now, "end": None})
+        self.save()
+
+    def observe(self, line):
+        """Advance the timeline from a yt-dlp output line"""
+        phase = phase_for_line(line)
+        if phase:
+            self.start_phase(phase)
+
+    def finish(self, status):
+        """Close the timeline and export it as spans"""
+        now = time.time()
+        self._end_phase(now)
+        self.record["status"] = status
+        self.record["finished_at"] = now
+        self.save()
+        export_spans(self.record)
+
+    def save(self):
+        """Atomically write the timeline to disk"""
+        TIMELINE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _timeline_path(self.record["job_id"])
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.record, f)
+        os.replace(tmp_path, path)
+
+
+def load_timeline(job_id):
+    """Read a saved timeline, returning None if there is none"""
+    try:
+        with open(_timeline_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def delete_timeline(job_id):
+    """Remove a job's saved timeline, if any"""
+    _timeline_path(job_id).unlink(missing_ok=True)
+
+
+def prune_timelines():
+    """Delete timelines not updated within the TTL; returns how many"""
+    cutoff = time.time() - TIMELINE_TTL
+    pruned = 0
+    for path in TIMELINE_DIR.glob("*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                pruned += 1
+        except FileNotFoundError:
+            continue
+    return pruned
+
+
+def start_pruner():
+    """Prune old timelines in the background of this worker"""
+    if not TIMELINE_TTL:
+        return
+
+    supervisor.start_periodic_task(
+        PRUNE_INTERVAL,
+        TIMELINE_DIR / PRUNE_LOCK_FILE,
+        prune_timelines,
+        "Timeline pruning",
+    )
+
+
+def _otlp_attributes(attributes):
+    """Convert a dict to an OTLP attribute list"""
+    return [
+        {"key": key, "value": {"stringValue": str(value)}}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def _nanos(seconds):
+    """Convert epoch seconds to the nanosecond strings OTLP/JSON uses"""
+    return str(int(seconds * 1e9))
+
+
+def to_otlp(record):
+    """Convert a finished timeline to an OTLP/JSON ExportTraceServiceRequest"""
+    trace_id = secrets.token_hex(16)
+    root_id = secrets.token_hex(8)
+    job_attributes = {"job.id": record["job_id"], "job.kind": record["kind"]}
+    job_attributes.update(record["attributes"])
+
+    spans = [
+        {
+            "traceId": trace_id,
+            "spanId": root_id,
+            "name": f"{record['kind']}_job",
+            "kind": 1,
+            "startTimeUnixNano": _nanos(record["started_at"]),
+            "endTimeUnixNano": _nanos(record["finished_at"]),
+            "attributes": _otlp_attributes(job_attributes),
+            # STATUS_CODE_OK or STATUS_CODE_ERROR
+            "status": {"code": 1 if record["status"] == "completed" else 2},
+        }
+    ]
+    for phase in record["phases"]:
+        spans.append(
+            {
+                "traceId": trace_id,
+                "spanId": secrets.token_hex(8),
+                "parentSpanId": root_id,
+                "name": phase["name"],
+                "kind": 1,
+                "startTimeUnixNano": _nanos(phase["start"]),
+                "endTimeUnixNano": _nanos(phase["end"]),
+                "attributes": _otlp_attributes({"job.id": record["job_id"]}),
+            }
+        )
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes({"service.name": SERVICE_NAME})
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def export_spans(record):
+    """Append a finished timeline to the trace file, one request per line"""
+    if not TRACE_FILE:
+        return
+
+    line = json.dumps(to_otlp(record)) + "\n"
+    Path(TRACE_FILE).parent.mkdir(parents=True, exist_ok=True)
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(line)
+
+
+@timeline_bp.route("/jobs/<job_id>/timeline")
+def job_timeline(job_id):
+    """Get the phase timeline of a download job"""
+    record = load_timeline(job_id) if job_id.isalnum() else None
+    if record is None:
+        return jsonify({"error": "Timeline not found"}), 404
+
+    now = time.time()
+    for phase in record["phases"]:
+        phase["duration"] = (phase["end"] or now) - phase["start"]
+
+    return jsonify(record)
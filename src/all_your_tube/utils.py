@@ -4,6 +4,8 @@ Utility functions for all-your-tube application.
 
 import os
 
+from . import cookies
+
 
 def validate_input(val):
     """Barest minimum code injection check"""
@@ -13,7 +15,10 @@ def validate_input(val):
 
 
 def get_cookies():
-    """Get AYT_YTDLP_COOKIE value and ensure absolute paths for cookie files"""
+    """Get AYT_YTDLP_COOKIE value and ensure absolute paths for cookie files.
+
+    Browser cookie extraction is replaced by a copy of the cached cookie jar.
+    """
     cookie_args = os.environ.get("AYT_YTDLP_COOKIE", "")
 
     if not cookie_args:
@@ -22,6 +27,10 @@ def get_cookies():
     # Split the cookie argument to check for --cookies flag
     parts = cookie_args.split()
 
+    # Browser extraction is slow, so hand out the shared exported jar instead
+    if "--cookies-from-browser" in parts:
+        return cookies.job_cookie_args(cookie_args)
+
     if len(parts) == 2:
         if parts[0] == "--cookies":
             cookie_path = parts[1]
@@ -0,0 +1,140 @@
+"""
+Test per-site admission control without actual downloads.
+"""
+
+import os
+import subprocess
+import time
+from unittest.mock import patch
+
+import pytest
+
+from all_your_tube import admission
+
+
+@pytest.fixture
+def limits(monkeypatch, tmp_path):
+    """Allow 2 concurrent downloads and 2 pending per site."""
+    monkeypatch.setattr(admission, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(admission, "SITE_CONCURRENCY", 2)
+    monkeypatch.setattr(admission, "SITE_RATE_PER_MINUTE", 10)
+    monkeypatch.setattr(admission, "SITE_MAX_PENDING", 2)
+    return tmp_path
+
+
+def _job(job_id, url="https://www.youtube.com/watch?v=x"):
+    """Build a minimal admission job."""
+    return {"id": job_id, "url": url, "workdir": "/tmp"}
+
+
+@pytest.mark.parametrize(
+    "url, site",
+    [
+        ("https://www.youtube.com/watch?v=x", "youtube.com"),
+        ("https://youtu.be/x", "youtube.com"),
+        ("https://player.vimeo.com/video/1", "vimeo.com"),
+        ("https://www.bbc.co.uk/iplayer/x", "bbc.co.uk"),
+    ],
+)
+def test_site_key(url, site):
+    """Test that URLs are grouped by the site they download from."""
+    assert admission.site_key(url) == site
+
+
+@pytest.mark.usefixtures("limits")
+def test_admit_limits_each_site():
+    """Test that a burst starts up to the limit, queues, then is rejected."""
+    decisions = [admission.admit(_job(str(i)))[0] for i in range(5)]
+
+    assert decisions == ["start", "start", "pending", "pending", "rejected"]
+    assert admission.admit(_job("other", "https://vimeo.com/1"))[0] == "start"
+
+
+@pytest.mark.usefixtures("limits")
+def test_rate_limit_sets_retry_after(monkeypatch):
+    """Test that the retry hint waits for the rate window to move on."""
+    monkeypatch.setattr(admission, "SITE_RATE_PER_MINUTE", 1)
+    monkeypatch.setattr(admission, "SITE_MAX_PENDING", 0)
+
+    assert admission.admit(_job("1"))[0] == "start"
+    decision, retry_after = admission.admit(_job("2"))
+
+    assert decision == "rejected"
+    assert 0 < retry_after <= admission.RATE_WINDOW
+
+
+@pytest.mark.usefixtures("limits")
+def test_pending_jobs_start_when_slots_free():
+    """Test that pending jobs are claimed once running ones exit."""
+    for i in range(3):
+        admission.admit(_job(str(i)))
+    assert not admission.take_ready()
+
+    # Neither running job is alive, so both slots free up
+    for i in range(2):
+        admission.mark_started(_job(str(i)) | {"site": "youtube.com"}, 2**22 + i)
+
+    assert [job["id"] for job in admission.take_ready()] == ["2"]
+
+
+@pytest.mark.usefixtures("limits")
+def test_job_that_fails_to_start_does_not_drop_the_rest():
+    """Test that claimed jobs after one that cannot start are still started."""
+    # This process stands in for the started downloads
+    jobs = [_job(str(i)) | {"workdir": os.getcwd()} for i in range(6)]
+    for job in jobs[:4]:
+        admission.admit(job)
+    for job in jobs[:2]:
+        admission.mark_started(job, 2**22)
+
+    failed = []
+
+    def start_job(job):
+        if job["id"] == "2":
+            raise FileNotFoundError("cookie jar")
+        return os.getpid()
+
+    admission.dispatch_ready(start_job, lambda job, error: failed.append(job["id"]))
+
+    assert failed == ["2"]
+    # The failed job gave its slot back, the started one still holds its own
+    assert admission.admit(jobs[4])[0] == "start"
+    assert admission.admit(jobs[5])[0] == "pending"
+
+
+@pytest.mark.usefixtures("limits")
+def test_exited_unreaped_download_frees_its_slot(tmp_path):
+    """Test that a zombie left behind by a recycled worker is not running."""
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(["true"], cwd=tmp_path)
+    # Let it exit without reaping it
+    time.sleep(0.2)
+
+    try:
+        for i in range(2):
+            job = _job(str(i)) | {"workdir": str(tmp_path)}
+            assert admission.admit(job)[0] == "start"
+            admission.mark_started(job, process.pid)
+
+        assert admission.admit(_job("2"))[0] == "start"
+    finally:
+        process.wait()
+
+
+@pytest.mark.usefixtures("limits")
+def test_save_returns_429_when_site_is_full(monkeypatch, client):
+    """Test that /save turns downloads away with Retry-After when full."""
+    monkeypatch.setattr(admission, "SITE_CONCURRENCY", 0)
+    monkeypatch.setattr(admission, "SITE_MAX_PENDING", 0)
+
+    with patch("all_your_tube.app.subprocess.Popen") as mock_popen:
+        response = client.post(
+            "/yourtube/save",
+            data={"url": "https://example.com/video"},
+            headers={"X-Requested-With": "XMLHttpRequest"},
+        )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(admission.DEFAULT_RETRY_AFTER)
+    assert response.get_json()["success"] is False
+    mock_popen.assert_not_called()
@@ -0,0 +1,118 @@
+"""
+Test the cached browser cookie jar without running yt-dlp.
+"""
+
+import fcntl
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from all_your_tube import cookies
+from all_your_tube.utils import get_cookies
+
+
+def _fake_export(cmd, **_kwargs):
+    """Write a jar to the path passed after --cookies, like yt-dlp does."""
+    jar = cmd[cmd.index("--cookies") + 1]
+    with open(jar, "w", encoding="utf-8") as f:
+        f.write("# Netscape HTTP Cookie File\n")
+
+
+@pytest.fixture
+def browser_cookies(tmp_path):
+    """Configure browser cookie extraction with an isolated workdir."""
+    env = {
+        "AYT_WORKDIR": str(tmp_path),
+        "AYT_YTDLP_COOKIE": "--cookies-from-browser chrome",
+    }
+    with patch.dict(os.environ, env):
+        with patch("all_your_tube.cookies.subprocess.run") as mock_run:
+            mock_run.side_effect = _fake_export
+            yield mock_run
+
+
+def test_browser_cookies_exported_once(browser_cookies):
+    """Test that jobs share one export but each get their own jar copy."""
+    first = get_cookies()
+    second = get_cookies()
+
+    assert browser_cookies.call_count == 1
+    assert first.startswith("--cookies ")
+    assert first != second
+    assert os.path.exists(first.split()[1])
+
+
+def test_jars_are_private_and_released(browser_cookies, tmp_path):
+    """Test that only the app user can read jars and job copies are deleted."""
+    cookie_args = get_cookies()
+    job_jar = cookie_args.split()[1]
+    cache_dir = tmp_path / ".cache" / "cookies"
+
+    assert browser_cookies.call_count == 1
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+    assert all(jar.stat().st_mode & 0o777 == 0o600 for jar in cache_dir.glob("*.txt"))
+    assert os.stat(job_jar).st_mode & 0o777 == 0o600
+
+    cookies.release_job_jars(["yt-dlp", *cookie_args.split(), "https://x"])
+    assert not os.path.exists(job_jar)
+
+
+def test_invalidated_jar_is_exported_again(browser_cookies):
+    """Test that an auth failure forces a fresh export from the browser."""
+    get_cookies()
+
+    assert cookies.invalidate_cookie_jar()
+    get_cookies()
+
+    assert browser_cookies.call_count == 2
+
+
+@pytest.mark.usefixtures("browser_cookies")
+def test_jar_is_not_discarded_while_copied(tmp_path):
+    """Test that invalidation waits for the jar lock held during copies."""
+    get_cookies()
+    (jar,) = (tmp_path / ".cache" / "cookies").glob("browser-*.txt")
+
+    with open(jar.with_suffix(".lock"), "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        invalidate = threading.Thread(target=cookies.invalidate_cookie_jar)
+        invalidate.start()
+        invalidate.join(0.2)
+        assert invalidate.is_alive()
+        assert jar.exists()
+
+    invalidate.join()
+    assert not jar.exists()
+
+
+def test_failed_copy_falls_back_and_cleans_up(browser_cookies, tmp_path):
+    """Test that a jar that cannot be copied leaves no partial job copy."""
+    with patch.object(cookies.shutil, "copyfileobj", side_effect=OSError("full")):
+        assert get_cookies() == "--cookies-from-browser chrome"
+
+    assert browser_cookies.call_count == 1
+    assert not list((tmp_path / ".cache" / "cookies" / "jobs").iterdir())
+
+
+def test_forbidden_is_not_an_auth_failure():
+    """Test that throttled fragments do not throw the shared jar away."""
+    assert not cookies.is_auth_failure(
+        "ERROR: unable to download video data: HTTP Error 403: Forbidden"
+    )
+    assert cookies.is_auth_failure("ERROR: Sign in to confirm you're not a bot")
+
+
+def test_failed_export_falls_back_to_browser(browser_cookies):
+    """Test that yt-dlp extracts cookies itself if the export fails."""
+    browser_cookies.side_effect = None
+
+    assert get_cookies() == "--cookies-from-browser chrome"
+
+
+def test_cookie_file_is_not_cached(tmp_path):
+    """Test that an explicit cookie file is passed through untouched."""
+    env = {"AYT_WORKDIR": str(tmp_path), "AYT_YTDLP_COOKIE": "--cookies /tmp/c"}
+    with patch.dict(os.environ, env):
+        assert get_cookies() == "--cookies /tmp/c"
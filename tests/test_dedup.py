@@ -0,0 +1,75 @@
+"""
+Test content-hash deduplication of downloaded media.
+"""
+
+import os
+import time
+
+import pytest
+
+from all_your_tube import dedup
+
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    """Use a library whose files count as settled straight away."""
+    monkeypatch.setattr(dedup, "SETTLE_TIME", 0)
+    return tmp_path
+
+
+def _write(path, content):
+    """Write a media file, creating its folder."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    # Make sure the file looks settled
+    old = time.time() - 60
+    os.utime(path, (old, old))
+    return path
+
+
+def test_identical_files_are_hard_linked(library):
+    """Test that duplicates across folders end up sharing one inode."""
+    first = _write(library / "music" / "a.mp4", b"same video")
+    second = _write(library / "talks" / "a.mp4", b"same video")
+    other = _write(library / "talks" / "b.mp4", b"different!")
+
+    assert dedup.deduplicate(library) == len(b"same video")
+
+    assert os.path.samefile(first, second)
+    assert not os.path.samefile(first, other)
+    assert second.read_bytes() == b"same video"
+
+
+def test_only_new_files_are_hashed(library, monkeypatch):
+    """Test that indexed files are not hashed again on the next pass."""
+    _write(library / "a.mp4", b"one")
+    _write(library / "b.mp4", b"two")
+    dedup.deduplicate(library)
+
+    hashed = []
+    real_digest = dedup.file_digest
+
+    def tracking_digest(path):
+        hashed.append(os.path.basename(path))
+        return real_digest(path)
+
+    monkeypatch.setattr(dedup, "file_digest", tracking_digest)
+    _write(library / "c.mp4", b"one")
+    dedup.deduplicate(library)
+
+    assert hashed == ["c.mp4"]
+    assert os.path.samefile(library / "a.mp4", library / "c.mp4")
+
+
+def test_state_directories_and_unique_sizes_are_skipped(library, monkeypatch):
+    """Test that app state is ignored and unique sizes are never hashed."""
+    _write(library / "queue" / "job" / "a.mp4", b"same")
+    _write(library / "b.mp4", b"same")
+    _write(library / "c.mp4", b"unique size")
+
+    hashed = []
+    monkeypatch.setattr(dedup, "file_digest", hashed.append)
+
+    assert dedup.deduplicate(library) == 0
+    assert not hashed
+    assert os.stat(library / "b.mp4").st_nlink == 1
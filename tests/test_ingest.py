@@ -0,0 +1,90 @@
+"""
+Test the bulk ingest CLI without actual downloads.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    """Import the ingest module with an isolated queue directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with patch.dict(os.environ, {"AYT_WORKDIR": str(Path(temp_dir))}):
+            # pylint: disable=import-outside-toplevel
+            from all_your_tube import ingest, queue
+
+            monkeypatch.setattr(queue, "WORKDIR", tmp_path)
+            monkeypatch.setattr(queue, "QUEUE_DIR", tmp_path / "queue")
+            queue.QUEUE_DIR.mkdir()
+            yield ingest
+
+
+def _save_record(queue_module, queue_id, url, status):
+    """Persist a queue record for url with the given status."""
+    job_dir = queue_module.QUEUE_DIR / queue_id
+    job_dir.mkdir(exist_ok=True)
+    queue_module.supervisor.save_job(
+        job_dir,
+        {
+            "id": queue_id,
+            "url": url,
+            "quality": "best",
+            "status": status,
+            "created_at": "2024-01-01T00:00:00",
+            "pid": None,
+        },
+    )
+
+
+def test_ingest_skips_completed_urls(ingest, tmp_path, capsys):
+    """Test that a rerun only downloads URLs that have not completed."""
+    queue_module = ingest.queue
+    _save_record(queue_module, "done", "https://example.com/a", "completed")
+    _save_record(queue_module, "broken", "https://example.com/b", "failed")
+    _save_record(queue_module, "evicted", "https://example.com/d", "expired")
+
+    url_list = tmp_path / "urls.txt"
+    url_list.write_text(
+        "# backlog\nhttps://example.com/a\nhttps://example.com/b\n"
+        "https://example.com/b\nhttps://example.com/c\nhttps://example.com/d\n"
+    )
+
+    def fake_enqueue(url, _quality, keep=False):
+        assert keep
+        queue_id = url.rsplit("/", 1)[-1] + "-new"
+        _save_record(queue_module, queue_id, url, "queued")
+        return {"id": queue_id}
+
+    def fake_process(queue_id):
+        record = queue_module.supervisor.load_job(queue_module.QUEUE_DIR / queue_id)
+        _save_record(queue_module, queue_id, record["url"], "completed")
+
+    with patch.object(queue_module, "enqueue", side_effect=fake_enqueue) as enqueue:
+        with patch.object(queue_module, "process_queue_item", fake_process):
+            with pytest.raises(SystemExit) as exit_info:
+                ingest.main([str(url_list), "--jobs", "2"])
+
+    assert exit_info.value.code == 0
+    assert sorted(call.args[0] for call in enqueue.call_args_list) == [
+        "https://example.com/b",
+        "https://example.com/c",
+    ]
+    assert "Ingested 4 URLs (2 completed, 2 skipped)" in capsys.readouterr().out
+
+
+def test_ingest_reports_failures(ingest, tmp_path, capsys):
+    """Test that URLs whose metadata cannot be fetched fail the run."""
+    url_list = tmp_path / "urls.txt"
+    url_list.write_text("https://example.com/a\nhttps://example.com/b;rm\n")
+
+    with patch.object(ingest.queue, "enqueue", return_value=None):
+        with pytest.raises(SystemExit) as exit_info:
+            ingest.main([str(url_list)])
+
+    assert exit_info.value.code == 1
+    assert "(1 failed, 1 invalid)" in capsys.readouterr().out
@@ -0,0 +1,249 @@
+"""
+Test queue job supervision without actual downloads.
+"""
+
+import fcntl
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def queue_module(monkeypatch, tmp_path):
+    """Import the queue module with an isolated queue directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with patch.dict(os.environ, {"AYT_WORKDIR": str(Path(temp_dir))}):
+            # pylint: disable=import-outside-toplevel
+            from all_your_tube import queue
+
+            monkeypatch.setattr(queue, "QUEUE_DIR", tmp_path)
+            monkeypatch.setattr(queue, "download_queue", {})
+            yield queue
+
+
+def _dead_pid():
+    """Return the PID of a process that has already exited."""
+    with subprocess.Popen(["true"]) as process:
+        process.wait()
+    return process.pid
+
+
+def _write_job(queue_module, queue_id, **fields):
+    """Persist a queue record as if another worker had written it."""
+    job_dir = queue_module.QUEUE_DIR / queue_id
+    job_dir.mkdir()
+    record = {
+        "id": queue_id,
+        "url": "https://example.com/video",
+        "title": "Video",
+        "quality": "best",
+        "status": "processing",
+        "progress": 0,
+        "created_at": "2024-01-01T00:00:00",
+        "file_path": None,
+        "error": None,
+        "pid": None,
+        "output_dir": str(job_dir),
+    }
+    record.update(fields)
+    queue_module.supervisor.save_job(job_dir, record)
+    return job_dir
+
+
+def _write_job_fields(queue_module, queue_id, **fields):
+    """Update fields of a persisted queue record."""
+    job_dir = queue_module.QUEUE_DIR / queue_id
+    record = queue_module.supervisor.load_job(job_dir)
+    record.update(fields)
+    queue_module.supervisor.save_job(job_dir, record)
+
+
+def _wait_for_status(queue_module, queue_id, timeout=5):
+    """Poll the durable record until the job reaches a terminal state."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = queue_module.supervisor.load_job(queue_module.QUEUE_DIR / queue_id)
+        if record["status"] in queue_module.supervisor.TERMINAL_STATES:
+            return record
+        time.sleep(0.05)
+    raise AssertionError(f"queue item {queue_id} never finished")
+
+
+def test_spawned_job_records_exit_status(queue_module, tmp_path):
+    """Test that a spawned job logs, records its exit status and cleans up."""
+    lines = []
+    job_jar = tmp_path / "job-cookies.txt"
+    job_jar.write_text("cookies")
+    process = queue_module.supervisor.spawn_job(
+        ["sh", "-c", "echo '[download]  42.0% of 1MiB'; exit 3"],
+        tmp_path,
+        remove_after=[job_jar],
+    )
+
+    return_code = queue_module.supervisor.wait_for_exit(
+        tmp_path,
+        process.pid,
+        process=process,
+        on_output=lines.append,
+        poll_interval=0.05,
+    )
+
+    assert return_code == 3
+    assert lines == ["[download]  42.0% of 1MiB"]
+    assert not job_jar.exists()
+
+
+def test_reattached_job_ends_when_shell_is_a_zombie(queue_module, tmp_path):
+    """Test that an exited but unreaped job is not mistaken for running."""
+    supervisor = queue_module.supervisor
+    process = supervisor.spawn_job(["sh", "-c", "exit 4"], tmp_path)
+    while supervisor.read_exit_status(tmp_path) is None:
+        time.sleep(0.05)
+    # Give the shell time to exit, without reaping it
+    time.sleep(0.2)
+
+    try:
+        assert not supervisor.job_running(process.pid, tmp_path)
+        assert supervisor.wait_for_exit(tmp_path, process.pid, poll_interval=0.05) == 4
+    finally:
+        process.wait()
+
+
+def test_periodic_task_survives_errors_and_records_runs(queue_module, tmp_path):
+    """Test that a failing task is logged, not fatal, and not rerun too soon."""
+    supervisor = queue_module.supervisor
+    lock_path = tmp_path / "tasks" / "task.lock"
+    runs = []
+
+    def task():
+        runs.append(time.time())
+        raise ValueError("boom")
+
+    # Due straight away as it never ran, then not again within the interval
+    assert supervisor.run_periodic_task(3600, lock_path, task, "Task")
+    assert not supervisor.run_periodic_task(3600, lock_path, task, "Task")
+    assert len(runs) == 1
+    assert lock_path.with_suffix(".last").exists()
+
+    # Skipped while another worker holds the lock, however overdue
+    with open(lock_path, "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert not supervisor.run_periodic_task(0, lock_path, task, "Task")
+    assert len(runs) == 1
+
+
+def test_recover_reconciles_finished_job(queue_module):
+    """Test that a job whose worker died is completed from its output files."""
+    job_dir = _write_job(queue_module, "100", pid=_dead_pid())
+    (job_dir / queue_module.supervisor.EXIT_FILE).write_text("0\n")
+    (job_dir / "Video.mp4").write_bytes(b"video")
+
+    queue_module.recover_queue()
+
+    record = _wait_for_status(queue_module, "100")
+    assert record["status"] == "completed"
+    assert record["file_path"] == str(job_dir / "Video.mp4")
+
+
+def test_recover_fails_interrupted_job(queue_module):
+    """Test that a job killed without an exit status is marked failed."""
+    _write_job(queue_module, "101", pid=_dead_pid())
+
+    queue_module.recover_queue()
+
+    record = _wait_for_status(queue_module, "101")
+    assert record["status"] == "failed"
+    assert record["error"] == "Download interrupted"
+
+
+def test_recover_leaves_subscription_videos_to_their_slots(queue_module):
+    """Test that recovery does not start every waiting subscription video."""
+    _write_job(queue_module, "106", status="queued", subscription="sub")
+
+    with patch.object(queue_module, "resume_queue_item") as resume:
+        queue_module.recover_queue()
+
+    resume.assert_not_called()
+
+
+def test_queue_status_reads_durable_record(queue_module, client):
+    """Test that status is served for jobs owned by another worker."""
+    _write_job(queue_module, "102", status="completed", progress=100)
+
+    response = client.get("/yourtube/queue-status/102")
+
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "completed"
+
+
+def test_head_request_releases_serve_lock(queue_module, client):
+    """Test that the output can be evicted once a response without a body closes."""
+    job_dir = _write_job(queue_module, "103", status="completed")
+    video = job_dir / "Video.mp4"
+    video.write_bytes(b"video")
+    _write_job_fields(queue_module, "103", file_path=str(video))
+
+    locks = []
+    open_for_serving = queue_module.storage.open_for_serving
+
+    def track_lock(path):
+        locks.append(open_for_serving(path))
+        return locks[-1]
+
+    with patch.object(queue_module.storage, "open_for_serving", track_lock):
+        response = client.head("/yourtube/queue-download-file/103")
+        # WSGI servers close the response once it has been sent
+        response.close()
+
+    assert response.status_code == 200
+    assert locks[0].closed
+
+
+def test_output_evicted_while_opening_is_gone(queue_module, client):
+    """Test that an output evicted before the serve lock is taken returns 410."""
+    job_dir = _write_job(queue_module, "104", status="completed")
+    open_for_serving = queue_module.storage.open_for_serving
+
+    def evict_then_open(path):
+        _write_job_fields(queue_module, "104", status="expired")
+        return open_for_serving(path)
+
+    with patch.object(queue_module.storage, "open_for_serving", evict_then_open):
+        response = client.get("/yourtube/queue-download-file/104")
+
+    assert response.status_code == 410
+    assert (job_dir / queue_module.storage.SERVE_LOCK_FILE).exists()
+
+
+def test_job_finished_by_another_worker_is_not_started_again(queue_module):
+    """Test that the durable record is checked once the job is supervised."""
+    with patch.object(queue_module, "_probe_metadata") as probe:
+        probe.return_value = subprocess.CompletedProcess(
+            [], 0, stdout='{"title": "Video"}', stderr=""
+        )
+        item = queue_module.enqueue("https://example.com/video", "best")
+    # Another worker recovered the job and saw it through
+    _write_job_fields(queue_module, item["id"], status="completed", pid=_dead_pid())
+
+    with patch.object(queue_module.supervisor, "spawn_job") as spawn_job:
+        queue_module.process_queue_item(item["id"])
+
+    spawn_job.assert_not_called()
+    assert queue_module.download_queue[item["id"]]["status"] == "completed"
+
+
+def test_job_started_by_another_worker_is_reattached(queue_module):
+    """Test that a job with a recorded PID is followed rather than respawned."""
+    job_dir = _write_job(queue_module, "105", status="processing", pid=_dead_pid())
+    (job_dir / queue_module.supervisor.EXIT_FILE).write_text("1\n")
+
+    with patch.object(queue_module.supervisor, "spawn_job") as spawn_job:
+        queue_module.process_queue_item("105")
+
+    spawn_job.assert_not_called()
+    assert _wait_for_status(queue_module, "105")["error"] == "Download failed"
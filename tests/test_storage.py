@@ -0,0 +1,91 @@
+"""
+Test garbage collection of queue outputs.
+"""
+
+import time
+
+import pytest
+
+from all_your_tube import storage, supervisor, timeline
+
+
+@pytest.fixture
+def queue_dir(monkeypatch, tmp_path):
+    """Use an isolated queue directory with a 10 byte quota and 1 hour TTL."""
+    monkeypatch.setattr(storage, "QUEUE_QUOTA_BYTES", 10)
+    monkeypatch.setattr(storage, "QUEUE_TTL", 3600)
+    monkeypatch.setattr(timeline, "TIMELINE_DIR", tmp_path / "timelines")
+    return tmp_path
+
+
+def _completed_job(queue_dir, queue_id, size, last_access, served_at=None):
+    """Create a completed job with an output file of the given size."""
+    job_dir = queue_dir / queue_id
+    job_dir.mkdir()
+    video = job_dir / "video.mp4"
+    video.write_bytes(b"x" * size)
+    supervisor.save_job(
+        job_dir,
+        {
+            "id": queue_id,
+            "status": "completed",
+            "file_path": str(video),
+            "size": size,
+            "last_access": last_access,
+            "served_at": served_at,
+        },
+    )
+    return job_dir
+
+
+def test_quota_evicts_least_recently_used(queue_dir):
+    """Test that the oldest outputs go first until under the quota."""
+    now = time.time()
+    oldest = _completed_job(queue_dir, "1", 6, now - 30)
+    older = _completed_job(queue_dir, "2", 6, now - 20)
+    newest = _completed_job(queue_dir, "3", 4, now - 10)
+
+    assert storage.collect_garbage(queue_dir) == 1
+
+    assert supervisor.load_job(oldest)["status"] == "expired"
+    assert not (oldest / "video.mp4").exists()
+    assert (oldest / supervisor.JOB_FILE).exists()
+    assert supervisor.load_job(older)["status"] == "completed"
+    assert supervisor.load_job(newest)["status"] == "completed"
+
+
+def test_ttl_only_applies_once_served(queue_dir):
+    """Test that outputs expire after the TTL only if they were served."""
+    stale = time.time() - 7200
+    served = _completed_job(queue_dir, "1", 1, stale, served_at=stale)
+    unserved = _completed_job(queue_dir, "2", 1, stale)
+    timeline.JobTimeline("1", "queue").save()
+
+    assert storage.collect_garbage(queue_dir) == 1
+
+    assert supervisor.load_job(served)["status"] == "expired"
+    assert supervisor.load_job(unserved)["status"] == "completed"
+    assert timeline.load_timeline("1") is None
+
+
+def test_kept_outputs_are_not_evicted(queue_dir):
+    """Test that outputs queued to be kept are exempt from quota and TTL."""
+    stale = time.time() - 7200
+    job_dir = _completed_job(queue_dir, "1", 20, stale, served_at=stale)
+    record = supervisor.load_job(job_dir)
+    supervisor.save_job(job_dir, record | {"keep": True})
+
+    assert storage.collect_garbage(queue_dir) == 0
+    assert supervisor.load_job(job_dir)["status"] == "completed"
+
+
+def test_output_being_served_is_not_evicted(queue_dir):
+    """Test that a file being streamed survives collection."""
+    stale = time.time() - 7200
+    job_dir = _completed_job(queue_dir, "1", 20, stale, served_at=stale)
+
+    with storage.open_for_serving(job_dir):
+        assert storage.collect_garbage(queue_dir) == 0
+
+    assert (job_dir / "video.mp4").exists()
+    assert storage.collect_garbage(queue_dir) == 1
@@ -0,0 +1,78 @@
+"""
+Test direct-to-client streaming without running yt-dlp.
+"""
+
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+# The unpatched class, for fakes that run a real command
+RealPopen = subprocess.Popen
+
+
+def _fake_ytdlp(output_cmd):
+    """Build a Popen stand-in that prints a filename and runs output_cmd."""
+
+    def popen(cmd, **kwargs):
+        name_file = cmd[cmd.index("--print-to-file") + 2]
+        Path(name_file).write_text("My Video: Part 1.mp4\n", encoding="utf-8")
+        return RealPopen(output_cmd, **kwargs)
+
+    return popen
+
+
+@patch("all_your_tube.streaming.subprocess.Popen")
+def test_stream_download_relays_stdout(mock_popen, client):
+    """Test that yt-dlp's stdout is streamed as an attachment."""
+    mock_popen.side_effect = _fake_ytdlp(["printf", "video-bytes"])
+
+    response = client.get(
+        "/yourtube/stream-download", query_string={"url": "https://example.com/v"}
+    )
+
+    assert response.status_code == 200
+    assert response.data == b"video-bytes"
+    assert response.headers["Content-Type"] == "video/mp4"
+    assert (
+        response.headers["Content-Disposition"]
+        == 'attachment; filename="My Video Part 1.mp4"'
+    )
+    cmd = mock_popen.call_args.args[0]
+    assert cmd[cmd.index("-o") + 1] == "-"
+    assert "+" not in cmd[cmd.index("-f") + 1]
+
+
+@patch("all_your_tube.streaming.subprocess.Popen")
+def test_stream_download_reports_failure(mock_popen, client):
+    """Test that a failure before any bytes returns an error."""
+    mock_popen.side_effect = _fake_ytdlp(["false"])
+
+    response = client.get(
+        "/yourtube/stream-download", query_string={"url": "https://example.com/v"}
+    )
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Failed to stream video"
+
+
+@patch("all_your_tube.streaming.subprocess.Popen")
+def test_head_request_stops_ytdlp(mock_popen, client):
+    """Test that yt-dlp is stopped when the body is never sent."""
+    processes = []
+
+    def popen(cmd, **kwargs):
+        process = _fake_ytdlp(["sh", "-c", "printf video; sleep 30"])(cmd, **kwargs)
+        processes.append(process)
+        return process
+
+    mock_popen.side_effect = popen
+
+    response = client.head(
+        "/yourtube/stream-download", query_string={"url": "https://example.com/v"}
+    )
+
+    # WSGI servers close the response once it has been sent
+    response.close()
+
+    assert response.status_code == 200
+    assert processes[0].poll() is not None
@@ -0,0 +1,202 @@
+"""
+Test incremental subscription checks without actual downloads.
+"""
+
+import fcntl
+import json
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+from all_your_tube import subscriptions
+
+# The unpatched class, for fakes that run a real command
+RealPopen = subprocess.Popen
+
+
+@pytest.fixture
+def subs(monkeypatch, tmp_path):
+    """Use an isolated subscription directory."""
+    monkeypatch.setattr(subscriptions, "SUBSCRIPTION_DIR", tmp_path)
+    monkeypatch.setattr(subscriptions.queue, "QUEUE_DIR", tmp_path / "queue")
+    (tmp_path / "queue").mkdir()
+    return subscriptions
+
+
+def _listing(*video_ids):
+    """Build flat listing output for videos, newest first."""
+    return [
+        json.dumps({"id": video_id, "url": f"https://example.com/{video_id}"})
+        for video_id in video_ids
+    ]
+
+
+def _listing_entries(*video_ids):
+    """Build parsed listing entries, newest first."""
+    return [json.loads(line) for line in _listing(*video_ids)]
+
+
+def test_read_new_entries_stops_at_seen_video():
+    """Test that reading stops at the first video already seen."""
+    entries, stopped = subscriptions.read_new_entries(
+        _listing("c", "b", "a"), ["b", "x"], 50
+    )
+
+    assert [entry["id"] for entry in entries] == ["c"]
+    assert stopped
+
+
+def test_listing_stops_without_waiting_for_the_rest(subs):
+    """Test that yt-dlp is stopped once a seen video is listed."""
+    script = "import sys, time\n" + "".join(
+        f"print({line!r}, flush=True)\n" for line in _listing("c", "b", "a")
+    )
+    script += "time.sleep(30)\n"
+    record = subs.create_subscription("https://example.com/channel", "best")
+    record["seen_ids"] = ["b"]
+
+    def popen(_cmd, **kwargs):
+        return RealPopen([sys.executable, "-c", script], **kwargs)
+
+    started = time.monotonic()
+    with patch.object(subs.subprocess, "Popen", popen):
+        entries = subs.list_new_entries(record)
+
+    assert [entry["id"] for entry in entries] == ["c"]
+    assert time.monotonic() - started < 10
+
+
+def test_playlist_listing_reads_newest_videos_from_the_end(subs):
+    """Test that playlists, which list oldest first, still find new videos."""
+    script = "".join(f"print({line!r})\n" for line in reversed(_listing("c", "b", "a")))
+    record = subs.create_subscription(
+        "https://www.youtube.com/playlist?list=PL123", "best"
+    )
+    record["seen_ids"] = ["b"]
+    commands = []
+
+    def popen(cmd, **kwargs):
+        commands.append(cmd)
+        return RealPopen([sys.executable, "-c", script], **kwargs)
+
+    with patch.object(subs.subprocess, "Popen", popen):
+        entries = subs.list_new_entries(record)
+
+    assert [entry["id"] for entry in entries] == ["c"]
+    assert "--lazy-playlist" not in commands[0]
+    assert commands[0][commands[0].index("--playlist-items") + 1] == (
+        f"-{subs.SUBSCRIPTION_MAX_NEW}:"
+    )
+
+
+def test_check_queues_only_new_videos(subs):
+    """Test that a check queues new videos oldest first and remembers them."""
+    record = subs.create_subscription("https://example.com/channel", "720p")
+    record["seen_ids"] = ["a"]
+
+    def fake_enqueue(url, _quality, keep=False, subscription=None):
+        assert keep
+        assert subscription == record["id"]
+        return {"id": url.rsplit("/", 1)[-1]}
+
+    with patch.object(
+        subs, "list_new_entries", return_value=_listing_entries("c", "b")
+    ):
+        with patch.object(subs.queue, "enqueue", side_effect=fake_enqueue) as enqueue:
+            assert subs.check_subscription(record) == 2
+
+    assert [call.args for call in enqueue.call_args_list] == [
+        ("https://example.com/b", "720p"),
+        ("https://example.com/c", "720p"),
+    ]
+    assert record["seen_ids"] == ["c", "b", "a"]
+
+
+def test_failed_videos_are_retried(subs):
+    """Test that videos that could not be queued are not lost."""
+    record = subs.create_subscription("https://example.com/channel", "best")
+    record["seen_ids"] = ["a"]
+
+    def flaky_enqueue(url, _quality, **_options):
+        if url.endswith(("/b", "/d")):
+            raise subprocess.TimeoutExpired("yt-dlp", 30)
+        return {"id": url.rsplit("/", 1)[-1]}
+
+    entries = _listing_entries("d", "c", "b")
+    with patch.object(subs, "list_new_entries", return_value=entries):
+        with patch.object(subs.queue, "enqueue", side_effect=flaky_enqueue):
+            assert subs.check_subscription(record) == 1
+
+    # d is newer than the last queued video so is listed again next time,
+    # while b is older and is retried from the subscription record
+    assert record["seen_ids"] == ["c", "b", "a"]
+    assert record["retry"] == [{"url": "https://example.com/b", "attempts": 1}]
+
+
+def test_failed_check_still_saves_subscription(subs):
+    """Test that an unexpected error is recorded rather than ending the check."""
+    record = subs.create_subscription("https://example.com/channel", "best")
+
+    with patch.object(subs, "list_new_entries", side_effect=ValueError("bad json")):
+        subs.check_due_subscriptions()
+
+    saved = subs.load_subscription(record["id"])
+    assert saved["error"] == "bad json"
+    assert saved["last_checked"] is not None
+
+
+def _write_queue_item(subs, queue_id, status, subscription="sub"):
+    """Persist a queue record as a check or another worker would."""
+    job_dir = subs.queue.QUEUE_DIR / queue_id
+    job_dir.mkdir()
+    record = {"id": queue_id, "status": status, "subscription": subscription}
+    subs.supervisor.save_job(job_dir, record)
+
+
+def test_pending_downloads_run_through_shared_slots(subs):
+    """Test that waiting videos are downloaded only by a free slot."""
+    _write_queue_item(subs, "01", "queued")
+    _write_queue_item(subs, "02", "completed")
+    _write_queue_item(subs, "03", "queued", subscription=None)
+    _write_queue_item(subs, "04", "processing")
+
+    with patch.object(subs.queue, "process_queue_item") as process:
+        subs.run_pending_downloads(0)
+    assert [call.args for call in process.call_args_list] == [("01",), ("04",)]
+
+    # Another worker holding the slot keeps this one from downloading
+    slot_path = subs.SUBSCRIPTION_DIR / subs.DOWNLOAD_SLOT_FILE.format(0)
+    with open(slot_path, "a", encoding="utf-8") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with patch.object(subs.queue, "process_queue_item") as process:
+            subs.run_pending_downloads(0)
+    process.assert_not_called()
+
+
+def test_first_check_only_records_latest_video(subs):
+    """Test that without backfill the first check queues nothing."""
+    record = subs.create_subscription("https://example.com/channel", "best")
+
+    with patch.object(subs, "list_new_entries", return_value=_listing_entries("z")):
+        with patch.object(subs.queue, "enqueue") as enqueue:
+            assert subs.check_subscription(record) == 0
+
+    enqueue.assert_not_called()
+    assert record["seen_ids"] == ["z"]
+
+
+def test_unsubscribe_removes_subscription(subs, client):
+    """Test subscribing and unsubscribing through the routes."""
+    response = client.post(
+        "/yourtube/subscriptions", data={"url": "https://example.com/channel"}
+    )
+    assert response.status_code == 201
+    subscription_id = response.get_json()["id"]
+
+    assert len(client.get("/yourtube/subscriptions").get_json()["items"]) == 1
+    response = client.delete(f"/yourtube/subscriptions/{subscription_id}")
+    assert response.status_code == 200
+    assert subs.load_subscription(subscription_id) is None
@@ -0,0 +1,92 @@
+"""
+Test per-job phase timelines without actual downloads.
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def timeline_module(monkeypatch, tmp_path):
+    """Import the timeline module writing into an isolated directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with patch.dict(os.environ, {"AYT_WORKDIR": str(Path(temp_dir))}):
+            # pylint: disable=import-outside-toplevel
+            from all_your_tube import timeline
+
+            monkeypatch.setattr(timeline, "TIMELINE_DIR", tmp_path / "timelines")
+            monkeypatch.setattr(timeline, "TRACE_FILE", str(tmp_path / "spans.jsonl"))
+            yield timeline
+
+
+@pytest.mark.parametrize(
+    "line, phase",
+    [
+        ("[youtube] Extracting URL: https://youtu.be/x", "extraction"),
+        ("[info] x: Writing video thumbnail 1 to: x.webp", "thumbnail"),
+        ("[download]  12.5% of 10.00MiB at 1.00MiB/s ETA 00:08", "download"),
+        ('[Merger] Merging formats into "x.mp4"', "merge"),
+        ('[EmbedThumbnail] ffmpeg: Adding thumbnail to "x.mp4"', "thumbnail"),
+        ("[FixupM3u8] Fixing MPEG-TS in MP4 container", "post_process"),
+        ("Download Complete", None),
+    ],
+)
+def test_phase_for_line(timeline_module, line, phase):
+    """Test that yt-dlp markers map to timeline phases."""
+    assert timeline_module.phase_for_line(line) == phase
+
+
+def test_finished_timeline_exports_spans(timeline_module):
+    """Test that a finished job is exported as one OTLP span per phase."""
+    timeline = timeline_module.JobTimeline("42", "queue", url="https://x")
+    timeline.start_phase("metadata_probe")
+    timeline.observe("[youtube] Extracting URL: https://x")
+    timeline.observe("[download]   1.0% of 1MiB")
+    timeline.observe("[download]   2.0% of 1MiB")
+    timeline.finish("completed")
+
+    with open(timeline_module.TRACE_FILE, encoding="utf-8") as f:
+        (request,) = [json.loads(line) for line in f]
+    spans = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+    assert [span["name"] for span in spans] == [
+        "queue_job",
+        "metadata_probe",
+        "extraction",
+        "download",
+    ]
+    assert all(span["parentSpanId"] == spans[0]["spanId"] for span in spans[1:])
+    assert len({span["traceId"] for span in spans}) == 1
+
+
+def test_old_timelines_are_pruned(timeline_module):
+    """Test that timelines not updated within the TTL are deleted."""
+    timeline_module.JobTimeline("44", "save").save()
+    timeline_module.JobTimeline("45", "save").save()
+    old = time.time() - timeline_module.TIMELINE_TTL - 60
+    os.utime(timeline_module.TIMELINE_DIR / "44.json", (old, old))
+
+    assert timeline_module.prune_timelines() == 1
+    assert timeline_module.load_timeline("44") is None
+    assert timeline_module.load_timeline("45") is not None
+
+
+def test_timeline_endpoint(timeline_module, client):
+    """Test that a job's timeline is served with phase durations."""
+    timeline = timeline_module.JobTimeline("43", "save")
+    timeline.start_phase("extraction")
+
+    response = client.get("/yourtube/jobs/43/timeline")
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] == "running"
+    assert data["phases"][0]["name"] == "extraction"
+    assert data["phases"][0]["duration"] >= 0
+    assert client.get("/yourtube/jobs/44/timeline").status_code == 404
@@ -2,28 +2,8 @@
 Test UI rendering without actual downloads.
 """
 
-import os
-import tempfile
-from pathlib import Path
 from unittest.mock import patch
 
-import pytest
-
-
-@pytest.fixture
-def client():
-    """Create a test client for the Flask app."""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        test_workdir = Path(temp_dir)
-        with patch.dict(os.environ, {"AYT_WORKDIR": str(test_workdir)}):
-            # Import app AFTER setting environment variable
-            # pylint: disable=import-outside-toplevel
-            from all_your_tube.app import app
-
-            app.config["TESTING"] = True
-            with app.test_client() as test_client:
-                yield test_client
-
 
 def test_index_page_renders(client):
     """Test that the main download form page renders correctly."""